@@ -9,12 +9,22 @@ from flask_security import Security, SQLAlchemyUserDatastore, hash_password
 
 from app import sitemap
 from app.auth.forms import MyLoginForm, RegistrationForm
+from app.common.assets import embed_assets
+from app.common.backends import get_redis_uri
+from app.common.bus import event_bus
+from app.common.clients import client_registry
+from app.common.coalesce import single_flight
 from app.common.helpers import mask_string, obfuscate_email, relative_timestamp
+from app.common.hub import activity_hub
+from app.common.raster import raster_pool
+from app.common.snapshots import activity_snapshots
 from app.common.utils import MyUsernameUtil
 from app.email import MyMailUtil
 from app.extensions import api, cache, cors, csrf, db, mail, migrate, sitemapper
 from app.models import Role, Service, User, WebAuthn
 from app.oauth.oauth2 import config_oauth
+from app.search.cache import search_cache
+from app.search.lyrics import lyrics_store
 from config import Config
 
 load_dotenv()
@@ -135,15 +145,15 @@ def create_app(config_class=Config):
     app.jinja_env.lstrip_blocks = True
 
     # Configure caching
-    if not app.debug:
-        if app.config.get("REDIS_URI") != "memory:///":
-            app.config["CACHE_TYPE"] = "RedisCache"
-            app.config["CACHE_REDIS_URL"] = app.config.get("REDIS_URI")
-            app.logger.info("Caching is enabled. Using redis for cache.")
-        else:
-            app.config["CACHE_TYPE"] = "NullCache"
-            app.config["CACHE_NO_NULL_WARNING"] = True
-            app.logger.info("Redis URI was not set. Caching is disabled.")
+    redis_uri = get_redis_uri(app)
+    if redis_uri:
+        app.config["CACHE_TYPE"] = "RedisCache"
+        app.config["CACHE_REDIS_URL"] = redis_uri
+        app.logger.info("Caching is enabled. Using redis for cache.")
+    elif not app.debug:
+        app.config["CACHE_TYPE"] = "NullCache"
+        app.config["CACHE_NO_NULL_WARNING"] = True
+        app.logger.info("Redis URI was not set. Caching is disabled.")
     else:
         app.config["CACHE_TYPE"] = (
             "SimpleCache"  # Use in-memory cache for local development
@@ -151,6 +161,15 @@ def create_app(config_class=Config):
         app.logger.warning("Redis URI was not set. Using in-memory cache.")
     app.config["CACHE_DEFAULT_TIMEOUT"] = 300  # Cache timeout in seconds (5 minutes)
     cache.init_app(app)
+    event_bus.init_app(app)
+    search_cache.init_app(app)
+    single_flight.init_app(app)
+    lyrics_store.init_app(app)
+    client_registry.init_app(app)
+    raster_pool.init_app(app)
+    embed_assets.init_app(app)
+    activity_hub.init_app(app)
+    activity_snapshots.init_app(app)
 
     # Configure Rate Limiting
     if app.config.get("RATELIMIT"):
@@ -158,6 +177,8 @@ def create_app(config_class=Config):
     else:
         app.logger.info("Ratelimit is disabled.")
 
+    # Same storage as everything else shared between processes
+    app.config.setdefault("RATELIMIT_STORAGE_URI", redis_uri or "memory:///")
     from app.limiter import limiter
     limiter.init_app(app)
 
@@ -3,18 +3,22 @@ from collections import OrderedDict
 from dataclasses import asdict
 from datetime import datetime, timezone
 
-import requests
 import sqlalchemy as sa
-from flask import flash, redirect, url_for
+from flask import flash, has_request_context, redirect, url_for
 from flask_security import current_user
 from yutipy.lastfm import LastFm, LastFmException
 
+from app.common.clients import client_registry
+from app.common.snapshots import activity_snapshots
 from app.extensions import db
 from app.models import Service, User, UserData, UserService
+from app.search.service import search_service
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
 
+client_registry.register("lastfm", lambda app: LastFm())
+
 
 FRESHNESS_SECONDS = 60  # For user activity data
 
@@ -52,7 +56,7 @@ def handle_lastfm_auth(lastfm_username):
         return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
 
     try:
-        with LastFm() as lastfm:
+        with client_registry.borrow("lastfm") as lastfm:
             # Try to fetch the user profile with provided username in the form
             result = lastfm.get_user_profile(lastfm_username)
             if not result:
@@ -92,10 +96,22 @@ def handle_lastfm_auth(lastfm_username):
         return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
 
 
-def get_lastfm_activity(user=None, platform="all", force_refresh=False):
-    """Fetch the user's listening activity from Last.fm."""
+def get_lastfm_activity(
+    user=None, platform="all", force_refresh=False, user_service=None
+):
+    """
+    Fetch the user's listening activity from Last.fm.
+
+    ``user_service`` is the Last.fm ``UserService`` of the user, if it's already loaded.
+    """
     user = user or current_user
-    lastfm_service = db.session.scalar(
+    if not force_refresh:
+        # Most polls end here, without touching the database
+        activity = activity_snapshots.fresh(user.id, "lastfm", FRESHNESS_SECONDS)
+        if activity is not None:
+            return activity
+
+    lastfm_service = user_service or db.session.scalar(
         sa.select(UserService)
         .join(Service)
         .where(UserService.user_id == user.id, Service.name.ilike("lastfm"))
@@ -109,21 +125,24 @@ def get_lastfm_activity(user=None, platform="all", force_refresh=False):
     if (
         not force_refresh
         and lastfm_service.user_data
-        and lastfm_service.user_data.updated_at
+        and lastfm_service.user_data.last_checked_at
     ):
-        updated_at = lastfm_service.user_data.updated_at
+        updated_at = lastfm_service.user_data.last_checked_at
         try:
             age = (datetime.now(timezone.utc) - updated_at).total_seconds()
         except TypeError:
             updated_at = updated_at.replace(tzinfo=timezone.utc)
             age = (datetime.now(timezone.utc) - updated_at).total_seconds()
         if age < FRESHNESS_SECONDS:
+            activity_snapshots.put(
+                user.id, "lastfm", activity_data, updated_at.timestamp()
+            )
             if not activity_data.get("activity_info", {}).get("is_playing", False):
                 activity_data["activity_info"]["is_playing"] = False
             return activity_data
 
     try:
-        with LastFm() as lastfm:
+        with client_registry.borrow("lastfm") as lastfm:
             fetched_activity = lastfm.get_currently_playing(
                 username=lastfm_service.username
             )
@@ -138,7 +157,7 @@ def get_lastfm_activity(user=None, platform="all", force_refresh=False):
                         fetched_activity.timestamp
                         or datetime.now(timezone.utc).timestamp()
                     )
-                    # For updating `updated_at` field in database
+                    # Saves the new play state, or only bumps `checked_at` if nothing changed
                     UserData.insert_or_update_user_data(lastfm_service, activity_data)
                     return activity_data
 
@@ -146,20 +165,13 @@ def get_lastfm_activity(user=None, platform="all", force_refresh=False):
                 is_playing = fetched_activity.pop("is_playing")
                 timestamp = fetched_activity.pop("timestamp")
 
-                # Dynamically determine the base URL for the /api/search endpoint
-                base_url = url_for("main.index", _external=True).rstrip("/")
-                search_url = f"{base_url}/api/search/{fetched_activity['artists']}:{fetched_activity['title']}?platform:{platform}"
-
-                # Call the /api/search endpoint using requests
-                try:
-                    response = requests.get(search_url, timeout=30)
-                    activity = {"music_info": response.json()}
-                except requests.RequestException as e:
-                    logger.warning(e)
-                    activity = {"music_info": fetched_activity}
-
-                if activity.get("music_info").get("error"):
-                    activity = {"music_info": fetched_activity}
+                # Same search as `/api/search`, without the round trip
+                music_info, status = search_service.search(
+                    fetched_activity["artists"], fetched_activity["title"]
+                )
+                activity = {
+                    "music_info": music_info if status == 200 else fetched_activity
+                }
 
                 # Add activity info
                 activity["activity_info"] = {
@@ -196,5 +208,8 @@ def get_lastfm_activity(user=None, platform="all", force_refresh=False):
             return None
 
     except LastFmException:
+        if not has_request_context():
+            # Nowhere to redirect to (e.g. polled in the background), up to the caller
+            raise
         flash(LASTFM_SERVICE_NOT_AVAILABLE, "error")
         return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
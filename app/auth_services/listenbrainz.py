@@ -3,17 +3,21 @@ from collections import OrderedDict
 from dataclasses import asdict
 from datetime import datetime, timezone
 
-import requests
 import sqlalchemy as sa
 from flask import flash, redirect, url_for
 from flask_security import current_user
 from yutipy.listenbrainz import ListenBrainz
 
+from app.common.clients import client_registry
+from app.common.snapshots import activity_snapshots
 from app.extensions import db
 from app.models import Service, User, UserData, UserService
+from app.search.service import search_service
 
 logger = logging.getLogger(__name__)
 
+client_registry.register("listenbrainz", lambda app: ListenBrainz())
+
 
 FRESHNESS_SECONDS = 60  # For user activity data
 
@@ -50,7 +54,7 @@ def handle_listenbrainz_auth(listenbrainz_username):
         flash("You have already liked ListenBrainz.", "info")
         return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
 
-    with ListenBrainz() as listenbrainz:
+    with client_registry.borrow("listenbrainz") as listenbrainz:
         username = listenbrainz.find_user(listenbrainz_username)
         if not username:
             flash(
@@ -77,10 +81,22 @@ def handle_listenbrainz_auth(listenbrainz_username):
     return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
 
 
-def get_listenbrainz_activity(user=None, platform="all", force_refresh=False):
-    """Fetch the user's listening activity from ListenBrainz."""
+def get_listenbrainz_activity(
+    user=None, platform="all", force_refresh=False, user_service=None
+):
+    """
+    Fetch the user's listening activity from ListenBrainz.
+
+    ``user_service`` is the ListenBrainz ``UserService`` of the user, if it's already loaded.
+    """
     user = user or current_user
-    listenbrainz_service = db.session.scalar(
+    if not force_refresh:
+        # Most polls end here, without touching the database
+        activity = activity_snapshots.fresh(user.id, "listenbrainz", FRESHNESS_SECONDS)
+        if activity is not None:
+            return activity
+
+    listenbrainz_service = user_service or db.session.scalar(
         sa.select(UserService)
         .join(Service)
         .where(UserService.user_id == user.id, Service.name.ilike("listenbrainz"))
@@ -89,24 +105,29 @@ def get_listenbrainz_activity(user=None, platform="all", force_refresh=False):
     if not listenbrainz_service:
         return None
 
-    activity_data = listenbrainz_service.user_data.data if listenbrainz_service.user_data else {}
+    activity_data = (
+        listenbrainz_service.user_data.data if listenbrainz_service.user_data else {}
+    )
     if (
         not force_refresh
         and listenbrainz_service.user_data
-        and listenbrainz_service.user_data.updated_at
+        and listenbrainz_service.user_data.last_checked_at
     ):
-        updated_at = listenbrainz_service.user_data.updated_at
+        updated_at = listenbrainz_service.user_data.last_checked_at
         try:
             age = (datetime.now(timezone.utc) - updated_at).total_seconds()
         except TypeError:
             updated_at = updated_at.replace(tzinfo=timezone.utc)
             age = (datetime.now(timezone.utc) - updated_at).total_seconds()
         if age < FRESHNESS_SECONDS:
+            activity_snapshots.put(
+                user.id, "listenbrainz", activity_data, updated_at.timestamp()
+            )
             if not activity_data.get("activity_info", {}).get("is_playing", False):
                 activity_data["activity_info"]["is_playing"] = False
             return activity_data
 
-    with ListenBrainz() as listenbrainz:
+    with client_registry.borrow("listenbrainz") as listenbrainz:
         fetched_activity = listenbrainz.get_currently_playing(
             listenbrainz_service.username
         )
@@ -127,20 +148,11 @@ def get_listenbrainz_activity(user=None, platform="all", force_refresh=False):
             is_playing = fetched_activity.pop("is_playing")
             timestamp = fetched_activity.pop("timestamp")
 
-            base_url = url_for("main.index", _external=True).rstrip("/")
-            search_url = f"{base_url}/api/search/{fetched_activity['artists']}:{fetched_activity['title']}"
-
-            try:
-                response = requests.get(
-                    search_url, params={"platform": platform}, timeout=30
-                )
-                activity = {"music_info": response.json()}
-            except requests.RequestException as e:
-                logger.warning(e)
-                activity = {"music_info": fetched_activity}
-
-            if activity.get("music_info").get("error"):
-                activity = {"music_info": fetched_activity}
+            # Same search as `/api/search`, without the round trip
+            music_info, status = search_service.search(
+                fetched_activity["artists"], fetched_activity["title"]
+            )
+            activity = {"music_info": music_info if status == 200 else fetched_activity}
 
             activity["activity_info"] = {
                 "is_playing": is_playing,
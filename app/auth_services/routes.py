@@ -1,3 +1,5 @@
+import time
+
 import sqlalchemy as sa
 from flask import abort, flash, redirect, request, url_for
 from flask_security import auth_required, current_user
@@ -7,6 +9,7 @@ from app.auth_services import bp
 from app.auth_services.lastfm import handle_lastfm_auth
 from app.auth_services.listenbrainz import handle_listenbrainz_auth
 from app.auth_services.spotify import handle_spotify_auth, handle_spotify_callback
+from app.common.bus import event_bus
 from app.models import Service, UserService
 from app.user.forms import LastfmLinkForm, ListenBrainzLinkForm
 
@@ -78,8 +81,20 @@ def unlink(service):
         return redirect(url_for("user.user_settings", username=current_user.username))
 
     # Delete the UserService entry
+    user_service_id = user_service.id
     db.session.delete(user_service)
     db.session.commit()
+    # Forget the activity of the service in every worker
+    event_bus.publish(
+        "activity",
+        {
+            "user_id": current_user.id,
+            "user_service_id": user_service_id,
+            "service": service_obj.name.lower(),
+            "data": None,
+            "updated_at": time.time(),
+        },
+    )
 
     flash(f"Successfully unlinked {service.capitalize()}!", "success")
     return redirect(url_for("user.user_settings", username=current_user.username))
@@ -3,15 +3,17 @@ from collections import OrderedDict
 from dataclasses import asdict
 from datetime import datetime, timezone
 
-import requests
 import sqlalchemy as sa
-from flask import flash, redirect, session, url_for
+from flask import flash, has_request_context, redirect, session, url_for
 from flask_security import current_user
 from yutipy.exceptions import AuthenticationException
 from yutipy.spotify import SpotifyAuth, SpotifyAuthException
 
 from app import db
+from app.common.snapshots import activity_snapshots
 from app.models import Service, User, UserData, UserService
+from app.search.crossref import lookup_platform_id
+from app.search.service import search_service
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
@@ -30,11 +32,21 @@ USER_SETTINGS_ENDPOINT = "user.user_settings"
 class MySpotifyAuth(SpotifyAuth):
     """Custom class to ovver-ride the `save_access_token` and `load_access_token` methods ~"""
 
-    def __init__(self, user=None, *args, **kwargs):
+    def __init__(self, user=None, *args, user_service=None, **kwargs):
         self.user = user  # Set user before calling super().__init__
+        # Already loaded Spotify `UserService` of the user, if any
+        self.user_service = user_service
         super().__init__(*args, **kwargs, defer_load=True)  # Defer token loading
 
     def save_access_token(self, token_info: dict) -> None:
+        if self.user_service is not None:
+            self.user_service.access_token = token_info.get("access_token")
+            self.user_service.refresh_token = token_info.get("refresh_token")
+            self.user_service.expires_in = token_info.get("expires_in")
+            self.user_service.requested_at = token_info.get("requested_at")
+            db.session.commit()
+            return None
+
         user = db.session.scalar(
             sa.select(User).where(User.username == self.user.username)
         )
@@ -88,6 +100,14 @@ class MySpotifyAuth(SpotifyAuth):
         return None
 
     def load_access_token(self) -> dict | None:
+        if self.user_service is not None:
+            return {
+                "access_token": self.user_service.access_token,
+                "refresh_token": self.user_service.refresh_token,
+                "expires_in": self.user_service.expires_in,
+                "requested_at": self.user_service.requested_at,
+            }
+
         user = db.session.scalar(
             sa.select(User).where(User.username == self.user.username)
         )
@@ -118,10 +138,12 @@ class MySpotifyAuth(SpotifyAuth):
         return None
 
 
-def get_spotify_auth(user=None):
+def get_spotify_auth(user=None, user_service=None):
     """Get an instance of MySpotifyAuth for the current user."""
     user = user or current_user
-    return MySpotifyAuth(user=user, scopes=["user-read-currently-playing"])
+    return MySpotifyAuth(
+        user=user, user_service=user_service, scopes=["user-read-currently-playing"]
+    )
 
 
 def handle_spotify_auth():
@@ -206,13 +228,25 @@ def handle_spotify_callback(request):
         return redirect(url_for(USER_SETTINGS_ENDPOINT, username=current_user.username))
 
 
-def get_spotify_activity(user=None, platform="all", force_refresh=False):
-    """Fetch the user's listening activity from Spotify."""
+def get_spotify_activity(
+    user=None, platform="all", force_refresh=False, user_service=None
+):
+    """
+    Fetch the user's listening activity from Spotify.
+
+    ``user_service`` is the Spotify ``UserService`` of the user, if it's already loaded.
+    """
     user = user or current_user
+    if not force_refresh:
+        # Most polls end here, without touching the database (or decrypting tokens)
+        activity = activity_snapshots.fresh(user.id, "spotify", FRESHNESS_SECONDS)
+        if activity is not None:
+            return activity
+
     try:
-        with get_spotify_auth(user=user) as spotify_auth:
+        with get_spotify_auth(user=user, user_service=user_service) as spotify_auth:
             spotify_auth.load_token_after_init()
-            spotify_service = db.session.scalar(
+            spotify_service = user_service or db.session.scalar(
                 sa.select(UserService)
                 .join(Service)
                 .where(
@@ -231,15 +265,18 @@ def get_spotify_activity(user=None, platform="all", force_refresh=False):
             if (
                 not force_refresh
                 and spotify_service.user_data
-                and spotify_service.user_data.updated_at
+                and spotify_service.user_data.last_checked_at
             ):
-                updated_at = spotify_service.user_data.updated_at
+                updated_at = spotify_service.user_data.last_checked_at
                 try:
                     age = (datetime.now(timezone.utc) - updated_at).total_seconds()
                 except TypeError:
                     updated_at = updated_at.replace(tzinfo=timezone.utc)
                     age = (datetime.now(timezone.utc) - updated_at).total_seconds()
                 if age < FRESHNESS_SECONDS:
+                    activity_snapshots.put(
+                        user.id, "spotify", activity_data, updated_at.timestamp()
+                    )
                     if activity_data and not activity_data.get("activity_info", {}).get(
                         "is_playing", False
                     ):
@@ -276,7 +313,7 @@ def get_spotify_activity(user=None, platform="all", force_refresh=False):
                                 ),
                             },
                         }
-                    # This is just to update the `updated_at` field in database
+                    # Saves the new play state, or only bumps `checked_at` if nothing changed
                     UserData.insert_or_update_user_data(spotify_service, activity_data)
                     return activity_data
 
@@ -294,29 +331,23 @@ def get_spotify_activity(user=None, platform="all", force_refresh=False):
                     "timestamp": timestamp,
                 }
 
-                if platform.lower() != "spotify":
-                    # Dynamically determine the base URL for the /api/search endpoint
-                    base_url = url_for("main.index", _external=True).rstrip("/")
-                    search_query = f"{fetched_dict.get('artists', '')}:{fetched_dict.get('title', '')}"
-                    from urllib.parse import quote
-
-                    search_url = (
-                        f"{base_url}/api/search/{quote(search_query)}?{platform}"
+                # Tracks that were searched before can be enriched from the local index
+                indexed = (
+                    lookup_platform_id("spotify", fetched_dict.get("id"))
+                    if platform.lower() != "spotify"
+                    else None
+                )
+                if indexed:
+                    activity["music_info"] = indexed
+                elif platform.lower() != "spotify":
+                    # Same search as `/api/search`, without the round trip
+                    music_info, status = search_service.search(
+                        fetched_dict.get("artists", ""), fetched_dict.get("title", "")
                     )
-
-                    # Call the /api/search endpoint using requests
-                    try:
-                        response = requests.get(
-                            search_url, params={"all": ""}, timeout=10
-                        )
-                        response.raise_for_status()
-                        data = response.json()
-                        if not data.get("error"):
-                            # Preserve activity_info when replacing music_info
-                            activity["music_info"] = data
-                    except (requests.RequestException, ValueError) as e:
-                        logger.warning(e)
-                        # Keep original Spotify data on error
+                    if status == 200:
+                        # Preserve activity_info when replacing music_info
+                        activity["music_info"] = music_info
+                    # Otherwise keep original Spotify data
 
                 # Sort the activity by keys
                 activity = dict(sorted(activity.items()))
@@ -350,6 +381,9 @@ def get_spotify_activity(user=None, platform="all", force_refresh=False):
 
             return None
     except SpotifyAuthException:
+        if not has_request_context():
+            # Nowhere to redirect to (e.g. polled in the background), up to the caller
+            raise
         flash(
             SPOTIFY_AUTH_NOT_AVAILABLE,
             "error",
@@ -0,0 +1,58 @@
+import os
+from types import MappingProxyType
+
+from app.common.helpers import get_static_file_data_uri
+
+# Static files embedded (as data URIs) in the SVG/PNG activity cards
+EMBED_ASSETS = {
+    "favicon.svg": "image/svg+xml",
+    "errors/no.gif": "image/gif",
+    "errors/no.png": "image/png",
+}
+
+
+class EmbedAssets:
+    """
+    Data URIs of the static files embedded in the activity cards.
+
+    They are read and encoded once, when the app is created. In debug mode,
+    a file is read again whenever it was modified since.
+    """
+
+    def __init__(self, app=None):
+        self.debug = False
+        self.static_folder = None
+        self._data_uris = MappingProxyType({})
+        self._mtimes = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.debug = app.debug
+        self.static_folder = app.static_folder
+        with app.app_context():
+            self._data_uris = MappingProxyType(
+                {
+                    filename: get_static_file_data_uri(filename, mimetype)
+                    for filename, mimetype in EMBED_ASSETS.items()
+                }
+            )
+        self._mtimes = {filename: self._mtime(filename) for filename in EMBED_ASSETS}
+        app.extensions["embed_assets"] = self
+
+    def data_uri(self, filename: str) -> str:
+        """Return the data URI of one of the ``EMBED_ASSETS``."""
+        if self.debug and self._mtime(filename) != self._mtimes.get(filename):
+            data_uris = dict(self._data_uris)
+            data_uris[filename] = get_static_file_data_uri(
+                filename, EMBED_ASSETS[filename]
+            )
+            self._data_uris = MappingProxyType(data_uris)
+            self._mtimes[filename] = self._mtime(filename)
+        return self._data_uris[filename]
+
+    def _mtime(self, filename: str) -> float:
+        return os.path.getmtime(os.path.join(self.static_folder, filename))
+
+
+embed_assets = EmbedAssets()
@@ -0,0 +1,15 @@
+from typing import Optional
+
+
+def get_redis_uri(app) -> Optional[str]:
+    """
+    Return the ``REDIS_URI`` to share state between processes through (cache,
+    ratelimits, locks, events, etc.), or None to keep it in memory of each one.
+
+    Redis is never used in debug mode, nor when ``REDIS_URI`` is the in-memory
+    storage of Flask-Limiter (``memory:///``).
+    """
+    redis_uri = app.config.get("REDIS_URI")
+    if redis_uri and redis_uri != "memory:///" and not app.debug:
+        return redis_uri
+    return None
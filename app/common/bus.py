@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import uuid
+from typing import Callable
+
+import redis
+
+from app.common.backends import get_redis_uri
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class LocalBroker:
+    """
+    In-process broker, every bus attached to it gets every message.
+
+    Used when Redis isn't configured (or in debug mode). A few buses attached
+    to the same broker behave like workers sharing a Redis server.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, data: str) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(data)
+
+    def listen(self, listener: Callable[[str], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def close(self) -> None:
+        with self._lock:
+            self._listeners.clear()
+
+
+class RedisBroker:
+    """Broker over a Redis pub/sub channel, shared by every worker (and node) using the same Redis."""
+
+    def __init__(self, redis_uri: str, channel: str):
+        self.channel = channel
+        self.redis = redis.Redis.from_url(redis_uri)
+        self._listeners = []
+        self._thread = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, data: str) -> None:
+        self.redis.publish(self.channel, data)
+
+    def listen(self, listener: Callable[[str], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="yutify-bus", daemon=True
+                )
+                self._thread.start()
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def _run(self) -> None:
+        backoff = 1
+        while not self._closed.is_set():
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                while not self._closed.is_set():
+                    message = pubsub.get_message(timeout=1)
+                    if message is None:
+                        continue
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode("utf-8")
+                    for listener in list(self._listeners):
+                        listener(data)
+                pubsub.close()
+            except redis.RedisError as e:
+                # Messages published in the meantime are lost, nothing depends on them
+                logger.warning(
+                    f"Lost connection to the event bus, retrying in {backoff}s: {e}"
+                )
+                self._closed.wait(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+class EventBus:
+    """
+    Publish/subscribe of events between the workers of the app.
+
+    Events are dispatched to the subscribers of the publishing worker right away
+    and broadcast (over Redis, if configured) to the other workers, which dispatch
+    them to their own subscribers. Subscribers are called in the thread publishing
+    or receiving the event, so they should be quick.
+
+    Events
+    ------
+    activity
+        A user's activity was stored: ``user_id``, ``user_service_id``, ``service``,
+        ``data`` (None if the service was unlinked) and ``updated_at`` (Unix timestamp).
+    search_cache.invalidate
+        A search result was replaced or removed by another worker: ``key``.
+    """
+
+    def __init__(self, app=None, broker=None):
+        self.origin = uuid.uuid4().hex
+        self.broker = None
+        self._handlers = {}
+        self._lock = threading.Lock()
+        if broker is not None:
+            self.attach(broker)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.broker is None:
+            redis_uri = get_redis_uri(app)
+            if redis_uri:
+                self.attach(
+                    RedisBroker(
+                        redis_uri, app.config.get("EVENT_BUS_CHANNEL", "yutify:events")
+                    )
+                )
+            else:
+                self.attach(LocalBroker())
+        app.extensions["event_bus"] = self
+
+    def attach(self, broker) -> None:
+        """Send and receive events through ``broker`` (e.g. a ``LocalBroker`` shared with other buses)."""
+        self.broker = broker
+        broker.listen(self._receive)
+
+    def subscribe(self, event: str, handler: Callable[[dict], None]) -> None:
+        """Call ``handler`` with the payload of every ``event``, from any worker."""
+        with self._lock:
+            self._handlers.setdefault(event, []).append(handler)
+
+    def publish(self, event: str, payload: dict) -> None:
+        """Dispatch ``event`` to the subscribers of every worker."""
+        self._dispatch(event, payload)
+        self.broadcast(event, payload)
+
+    def broadcast(self, event: str, payload: dict) -> None:
+        """
+        Dispatch ``event`` to the subscribers of the other workers only.
+
+        For events about state the publishing worker already updated itself
+        (e.g. ``search_cache.invalidate``), which its own subscribers would undo.
+        """
+        if self.broker is None:
+            return
+        message = {
+            "event": event,
+            "origin": self.origin,
+            "payload": payload,
+        }
+        try:
+            self.broker.publish(json.dumps(message, default=str))
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish '{event}' to the event bus: {e}")
+
+    def _receive(self, data: str) -> None:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed event bus message: {data[:100]}")
+            return
+        # Already dispatched (if meant for this worker at all) when it was published
+        if message.get("origin") == self.origin:
+            return
+        self._dispatch(message.get("event"), message.get("payload") or {})
+
+    def _dispatch(self, event: str, payload: dict) -> None:
+        with self._lock:
+            handlers = list(self._handlers.get(event, []))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.warning(f"Error occurred while handling '{event}' event: {e}")
+
+
+event_bus = EventBus()
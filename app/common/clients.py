@@ -0,0 +1,174 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+import requests
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+def instrument_client(client, timeout: float) -> None:
+    """
+    Cap the timeout of every HTTP request made by ``client`` and count the failed ones.
+
+    yutipy waits up to 30 seconds for every request, long after the caller gave up
+    on it, which keeps a (pooled) worker thread busy for nothing. It also returns
+    None both when nothing was found and when the request failed, so failures
+    (errors, 429 and 5xx responses) are counted in ``client.http_errors`` to tell
+    them apart. Applies to the ``requests.Session`` of the client and the ones of
+    the objects it holds (e.g. ``YTMusic``).
+    """
+    client.http_errors = 0
+    sessions = []
+    for value in vars(client).values():
+        if isinstance(value, requests.Session):
+            sessions.append(value)
+        elif hasattr(value, "__dict__"):
+            sessions.extend(
+                nested
+                for nested in vars(value).values()
+                if isinstance(nested, requests.Session)
+            )
+
+    for session in sessions:
+
+        def request(method, url, *args, _request=session.request, **kwargs):
+            if isinstance(kwargs.get("timeout"), (int, float)):
+                kwargs["timeout"] = min(kwargs["timeout"], timeout)
+            elif kwargs.get("timeout") is None:
+                kwargs["timeout"] = timeout
+            try:
+                response = _request(method, url, *args, **kwargs)
+            except requests.RequestException:
+                client.http_errors += 1
+                raise
+            if response.status_code == 429 or response.status_code >= 500:
+                client.http_errors += 1
+            return response
+
+        session.request = request
+
+
+class ClientRegistry:
+    """
+    Process-wide pools of long-lived provider clients (yutipy's ``Deezer``, ``LastFm``, etc.).
+
+    Every client holds a ``requests.Session``, so reusing them keeps the connections
+    to the provider alive between requests instead of doing a fresh TCP + TLS
+    handshake every time. A client is only ever used by one thread at a time:
+    it's borrowed from the pool and put back once the caller is done with it.
+
+    Clients are thrown away (and a new one is created on the next borrow) when:
+
+    - their session was closed,
+    - they are older than ``max_age`` seconds,
+    - the code using them raised an exception, or
+    - the pool already holds ``pool_size`` idle clients.
+    """
+
+    def __init__(self, app=None):
+        self.factories = {}
+        self.pool_size = 4
+        self.max_age = 600
+        self.http_timeout = 5
+        self.app = None
+        self._idle = {}  # name -> list of (created_at, client)
+        self._lock = threading.Lock()
+        atexit.register(self.close_all)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.pool_size = app.config.get("PROVIDER_CLIENT_POOL_SIZE", self.pool_size)
+        self.max_age = app.config.get("PROVIDER_CLIENT_MAX_AGE", self.max_age)
+        self.http_timeout = app.config.get("PROVIDER_HTTP_TIMEOUT", self.http_timeout)
+        # Clients may be bound to the previous app (e.g. to store access tokens)
+        self.close_all()
+        self.app = app
+        app.extensions["client_registry"] = self
+
+    def register(self, name: str, factory: Callable[[Any], Any]) -> None:
+        """
+        Register how to create the client called ``name``.
+
+        Parameters
+        ----------
+        name (str)
+            Name of the client (e.g. ``"deezer"``).
+        factory (callable)
+            Called with the Flask app and returns a new client.
+        """
+        self.factories[name] = factory
+
+    def is_healthy(self, created_at: float, client) -> bool:
+        """Whether a client can (still) be handed out."""
+        if getattr(client, "is_session_closed", False):
+            return False
+        return time.monotonic() - created_at < self.max_age
+
+    @contextmanager
+    def borrow(self, name: str):
+        """
+        Borrow the client called ``name`` for the duration of a ``with`` block.
+
+        Raises whatever the client's factory raises if a new client has to be
+        created (e.g. ``KKBoxException`` when KKBox credentials are missing).
+        """
+        entry = self._acquire(name)
+        healthy = False
+        try:
+            yield entry[1]
+            healthy = True
+        finally:
+            if healthy:
+                self._release(name, entry)
+            else:
+                self._close(name, entry[1])
+
+    def close_all(self) -> None:
+        """Close every idle client."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for name, entries in idle.items():
+            for _, client in entries:
+                self._close(name, client)
+
+    def _acquire(self, name: str) -> tuple:
+        while True:
+            with self._lock:
+                entries = self._idle.get(name)
+                entry = entries.pop() if entries else None
+            if entry is None:
+                break
+            if self.is_healthy(*entry):
+                return entry
+            self._close(name, entry[1])
+
+        if name not in self.factories:
+            raise KeyError(f"No client registered with the name '{name}'.")
+        logger.debug(f"Creating a new '{name}' client.")
+        client = self.factories[name](self.app)
+        instrument_client(client, self.http_timeout)
+        return time.monotonic(), client
+
+    def _release(self, name: str, entry: tuple) -> None:
+        if self.is_healthy(*entry):
+            with self._lock:
+                entries = self._idle.setdefault(name, [])
+                if len(entries) < self.pool_size:
+                    entries.append(entry)
+                    return
+        self._close(name, entry[1])
+
+    def _close(self, name: str, client) -> None:
+        try:
+            client.close_session()
+        except Exception as e:
+            logger.warning(f"Error occurred while closing '{name}' client: {e}")
+
+
+client_registry = ClientRegistry()
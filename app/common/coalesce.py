@@ -0,0 +1,112 @@
+import copy
+import logging
+import threading
+from typing import Callable
+
+import redis
+
+from app.common.backends import get_redis_uri
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A call in flight, shared by the thread doing the work and the ones waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical calls that are in flight at the same time.
+
+    The first caller for a key does the work, concurrent callers for the same key
+    wait for (and get a copy of) its result instead of doing the same work again.
+
+    Across processes, the callers doing the work take a Redis lock for the key
+    (if Redis is configured), so only one of them runs at a time. The work passed
+    to ``do()`` should therefore check the shared cache first, as the result may
+    have been produced by another process while waiting for the lock.
+    """
+
+    def __init__(self, app=None):
+        self.timeout = 10
+        self.redis = None
+        self._calls = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.timeout = app.config.get("SEARCH_COALESCE_TIMEOUT", self.timeout)
+        redis_uri = get_redis_uri(app)
+        if redis_uri:
+            self.redis = redis.Redis.from_url(redis_uri)
+        else:
+            self.redis = None
+        app.extensions["single_flight"] = self
+
+    def do(self, key: str, fn: Callable):
+        """
+        Return the result of ``fn()``, sharing it with concurrent calls for ``key``.
+
+        Callers that waited longer than ``timeout`` seconds for the result
+        give up waiting and call ``fn()`` themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is not None:
+                    raise call.error
+                logger.info(f"Coalesced with in-flight request for key: {key}")
+                return copy.deepcopy(call.result)
+            logger.warning(f"Timed out waiting for in-flight request for key: {key}")
+            return fn()
+
+        try:
+            call.result = self._call_with_lock(key, fn)
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _call_with_lock(self, key: str, fn: Callable):
+        if self.redis is None:
+            return fn()
+
+        lock = self.redis.lock(
+            f"lock:{key}", timeout=self.timeout, blocking_timeout=self.timeout
+        )
+        try:
+            acquired = lock.acquire()
+        except redis.RedisError as e:
+            logger.warning(f"Could not acquire lock for key {key}: {e}")
+            return fn()
+
+        if not acquired:
+            logger.warning(f"Timed out waiting for lock for key: {key}")
+        try:
+            return fn()
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis.RedisError as e:
+                    # Expired (and maybe taken by someone else) in the meantime
+                    logger.warning(f"Could not release lock for key {key}: {e}")
+
+
+single_flight = SingleFlight()
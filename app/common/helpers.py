@@ -2,9 +2,20 @@ import base64
 import os
 import re
 from datetime import datetime, timezone
+from io import BytesIO
 
 import requests
 from flask import current_app as app
+from PIL import Image
+
+from app.common.coalesce import single_flight
+from app.common.lru import LRUCache
+
+# Album arts are shown at 224x256 on the activity cards and rendered
+# at twice that size for PNGs, so anything bigger is wasted.
+ALBUM_ART_SIZE = 512
+ALBUM_ART_RETRY_AFTER = 300  # seconds
+album_art_cache = LRUCache(maxsize=256, ttl=24 * 3600)
 
 
 def is_valid_string(string: str) -> bool:
@@ -144,15 +155,61 @@ def obfuscate_email(email: str):
 
 
 def get_album_art_data_uri(url):
+    """
+    Return the album art at ``url`` as a (downscaled) data URI, or None if it can't be fetched.
+
+    Album arts are cached in memory (as data URIs), so rendering the same
+    card again doesn't wait on the image CDN.
+    """
+    if not url:
+        return None
+    data_uri = album_art_cache.get(url)
+    if data_uri is None:
+        data_uri = single_flight.do(f"album_art:{url}", lambda: _fetch_album_art(url))
+    return data_uri or None
+
+
+def _fetch_album_art(url):
+    data_uri = album_art_cache.get(url)
+    if data_uri is not None:
+        return data_uri
+
     try:
         resp = requests.get(url, timeout=5)
         if resp.ok:
             mime = resp.headers.get("Content-Type", "image/jpeg")
-            b64 = base64.b64encode(resp.content).decode("utf-8")
-            return f"data:{mime};base64,{b64}"
+            content, mime = make_thumbnail(resp.content, mime)
+            b64 = base64.b64encode(content).decode("utf-8")
+            data_uri = f"data:{mime};base64,{b64}"
+            album_art_cache.set(url, data_uri)
+            return data_uri
     except Exception:
         pass
-    return None
+    # Don't retry failed ones on every request, but don't give up on them either
+    album_art_cache.set(url, "", ttl=ALBUM_ART_RETRY_AFTER)
+    return ""
+
+
+def make_thumbnail(content: bytes, mime: str, size: int = None) -> tuple[bytes, str]:
+    """
+    Downscale an image to fit in ``size`` x ``size`` pixels (as JPEG, unless it has transparency).
+
+    Returns the image as is if it's already small enough or can't be read.
+    """
+    size = size or ALBUM_ART_SIZE
+    try:
+        with Image.open(BytesIO(content)) as image:
+            if image.width <= size and image.height <= size:
+                return content, mime
+            image.thumbnail((size, size))
+            output = BytesIO()
+            if image.mode in ("RGBA", "LA", "P"):
+                image.save(output, format="PNG", optimize=True)
+                return output.getvalue(), "image/png"
+            image.convert("RGB").save(output, format="JPEG", quality=85)
+            return output.getvalue(), "image/jpeg"
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return content, mime
 
 
 def get_static_file_data_uri(filename, mimetype):
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from app.common.bus import event_bus
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class ActivityHub:
+    """
+    In-process fan-out of "this user's activity changed" notifications.
+
+    Every change bumps a per-user version, watchers (e.g. SSE streams) wait
+    for the version to change. While a user has at least one watcher, a single
+    background poller per user keeps their activity up to date, no matter how
+    many watchers there are.
+    """
+
+    def __init__(self, app=None):
+        self.poll_interval = 15
+        self.app = None
+        self._versions = {}
+        self._watchers = {}
+        self._pollers = set()
+        self._condition = threading.Condition()
+        self._subscribed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.poll_interval = app.config.get(
+            "ACTIVITY_STREAM_POLL_INTERVAL", self.poll_interval
+        )
+        self.app = app
+        if not self._subscribed:
+            # Activity stored by any worker
+            event_bus.subscribe("activity", lambda event: self.notify(event["user_id"]))
+            self._subscribed = True
+        app.extensions["activity_hub"] = self
+
+    def notify(self, user_id: int) -> None:
+        """Let the watchers of ``user_id`` know that their activity changed."""
+        with self._condition:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def version(self, user_id: int) -> int:
+        with self._condition:
+            return self._versions.get(user_id, 0)
+
+    def wait(self, user_id: int, version: int, timeout: float) -> int:
+        """
+        Wait (up to ``timeout`` seconds) for the activity of ``user_id`` to change from ``version``.
+
+        Returns the current version, which is still ``version`` if it timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._versions.get(user_id, 0) != version, timeout
+            )
+            return self._versions.get(user_id, 0)
+
+    @contextmanager
+    def watch(self, user_id: int, poll: Callable[[int], None]):
+        """
+        Watch the activity of ``user_id`` for the duration of a ``with`` block.
+
+        Parameters
+        ----------
+        user_id (int)
+            The user to watch.
+        poll (callable)
+            Called with ``user_id`` (inside an app context) every ``poll_interval``
+            seconds, to fetch the activity from the linked services. Only used by
+            the first watcher of the user.
+        """
+        with self._condition:
+            self._watchers[user_id] = self._watchers.get(user_id, 0) + 1
+            start_poller = user_id not in self._pollers
+            self._pollers.add(user_id)
+        if start_poller:
+            threading.Thread(
+                target=self._poller,
+                args=(user_id, poll),
+                name=f"yutify-activity-poller-{user_id}",
+                daemon=True,
+            ).start()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._watchers[user_id] -= 1
+                if not self._watchers[user_id]:
+                    del self._watchers[user_id]
+
+    def _poller(self, user_id: int, poll: Callable[[int], None]) -> None:
+        while True:
+            with self._condition:
+                if user_id not in self._watchers:
+                    self._pollers.discard(user_id)
+                    return
+            started = time.monotonic()
+            try:
+                with self.app.app_context():
+                    poll(user_id)
+            except Exception as e:
+                logger.warning(
+                    f"Error occurred while polling activity of {user_id}: {e}"
+                )
+            time.sleep(max(self.poll_interval - (time.monotonic() - started), 0))
+
+
+activity_hub = ActivityHub()
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import threading
+from typing import Callable, Optional
+
+import redis
+import sqlalchemy as sa
+
+from app.common.backends import get_redis_uri
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+class RedisLease:
+    """Lease over a Redis lock, which expires ``ttl`` seconds after it was last renewed."""
+
+    def __init__(self, redis_uri: str, name: str, ttl: float):
+        self.name = name
+        self.redis = redis.Redis.from_url(redis_uri)
+        # Renewed by another thread than the one that acquired it
+        self.lock = self.redis.lock(name, timeout=ttl, thread_local=False)
+        self.held = False
+
+    def acquire(self) -> bool:
+        """Take the lease if it's free, or renew it if already held. Returns whether it's held."""
+        if self.held:
+            self.lock.reacquire()
+        else:
+            self.held = self.lock.acquire(blocking=False)
+        return self.held
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self.lock.release()
+
+
+class PostgresLease:
+    """
+    Lease over a Postgres advisory lock, held by a dedicated connection.
+
+    The lock goes away along with the connection, so it doesn't need to expire:
+    renewing just makes sure that the connection (and the lock) is still alive.
+    """
+
+    def __init__(self, engine: sa.Engine, name: str):
+        self.engine = engine
+        self.key = int.from_bytes(
+            hashlib.sha256(name.encode()).digest()[:8], "big", signed=True
+        )
+        self.connection = None
+        self.held = False
+
+    def acquire(self) -> bool:
+        """Take the lease if it's free, or renew it if already held. Returns whether it's held."""
+        try:
+            if self.connection is None:
+                self.connection = self.engine.connect()
+            if self.held:
+                self.connection.execute(sa.text("SELECT 1"))
+            else:
+                self.held = bool(
+                    self.connection.execute(
+                        sa.text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}
+                    ).scalar()
+                )
+            # Advisory locks are held by the session, no need to keep a transaction open
+            self.connection.commit()
+        except sa.exc.SQLAlchemyError:
+            self._close()
+            raise
+        return self.held
+
+    def release(self) -> None:
+        if self.connection is None:
+            return
+        try:
+            if self.held:
+                self.connection.execute(
+                    sa.text("SELECT pg_advisory_unlock(:key)"), {"key": self.key}
+                )
+                self.connection.commit()
+        finally:
+            self._close()
+
+    def _close(self) -> None:
+        self.held = False
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        try:
+            # Not back to the pool, in case it still holds the lock
+            connection.invalidate()
+        except sa.exc.SQLAlchemyError:
+            pass
+
+
+class LocalLease:
+    """Lease of a single process (e.g. SQLite, or in debug mode), always held."""
+
+    held = True
+
+    def acquire(self) -> bool:
+        return True
+
+    def release(self) -> None:
+        pass
+
+
+class Leadership:
+    """
+    Leader election between the processes (and nodes) of the app.
+
+    Only the process holding the lease is the leader. A background thread keeps
+    renewing it (or trying to take it) every ``ttl / 3`` seconds, so when the
+    leader dies, another process takes over once the lease expires (right away
+    with a Postgres advisory lock, as the lock goes away with the connection).
+
+    The lease is a Redis lock if Redis is configured, a Postgres advisory lock
+    if the database is Postgres, and always held otherwise.
+    """
+
+    def __init__(self, app=None, name: str = "yutify:leader", lease=None):
+        self.name = name
+        self.ttl = 60
+        self.lease = lease
+        self._on_elected = []
+        self._leader = False
+        self._stopped = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, engine: Optional[sa.Engine] = None):
+        self.ttl = app.config.get("SCHEDULER_LEASE_TTL", self.ttl)
+        if self.lease is None:
+            redis_uri = get_redis_uri(app)
+            if redis_uri:
+                self.lease = RedisLease(redis_uri, self.name, self.ttl)
+            elif engine is not None and engine.dialect.name == "postgresql":
+                self.lease = PostgresLease(engine, self.name)
+            else:
+                self.lease = LocalLease()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    def on_elected(self, callback: Callable[[], None]) -> None:
+        """Call ``callback`` every time this process becomes the leader."""
+        self._on_elected.append(callback)
+
+    def renew(self) -> bool:
+        """Renew the lease (or try to take it). Returns whether this process is the leader."""
+        was_leader = self._leader
+        try:
+            leader = self.lease.acquire()
+        except (redis.RedisError, sa.exc.SQLAlchemyError) as e:
+            # Lost (or couldn't reach) the lease, someone else may take over
+            logger.warning(f"Could not renew the '{self.name}' lease: {e}")
+            self.lease.held = False
+            leader = False
+
+        self._leader = leader
+        if leader and not was_leader:
+            logger.info(f"Elected leader for '{self.name}'.")
+            for callback in self._on_elected:
+                callback()
+        elif was_leader and not leader:
+            logger.warning(f"Lost the '{self.name}' lease.")
+        return leader
+
+    def start(self) -> None:
+        """Take part in the election, in a background thread, until ``stop()``."""
+        if self._thread is not None:
+            return
+        self.renew()
+        self._thread = threading.Thread(
+            target=self._run, name="yutify-leadership", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop taking part in the election and give up the lease, so others can take over right away."""
+        self._stopped.set()
+        self._leader = False
+        try:
+            self.lease.release()
+        except (redis.RedisError, sa.exc.SQLAlchemyError) as e:
+            logger.warning(f"Could not release the '{self.name}' lease: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.ttl / 3):
+            self.renew()
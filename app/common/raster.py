@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+def _svg2png(svg: bytes, scale: float) -> bytes:
+    # Imported in the worker processes only, it needs the native Cairo library
+    import cairosvg
+
+    return cairosvg.svg2png(bytestring=svg, scale=scale)
+
+
+class RasterPoolBusy(Exception):
+    """Raised when an SVG can't be rasterized right now, because the pool is full or too slow."""
+
+
+class RasterPool:
+    """
+    Size-limited process pool for converting SVGs to PNGs (with CairoSVG).
+
+    Rasterizing is CPU-heavy, doing it in separate processes keeps it off
+    the request threads (and the GIL). At most ``max_workers`` SVGs are
+    rasterized at once and ``max_queue`` more can wait for their turn,
+    anything beyond that is rejected right away with ``RasterPoolBusy``.
+    """
+
+    def __init__(self, app=None):
+        self.max_workers = 2
+        self.max_queue = 4
+        self.timeout = 10
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_workers = app.config.get("RASTER_WORKERS", self.max_workers)
+        self.max_queue = app.config.get("RASTER_MAX_QUEUE", self.max_queue)
+        self.timeout = app.config.get("RASTER_TIMEOUT", self.timeout)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self.shutdown()
+        app.extensions["raster_pool"] = self
+
+    def svg2png(self, svg: str, scale: float = 2) -> bytes:
+        """
+        Convert an SVG to PNG in the pool.
+
+        Raises
+        ------
+        RasterPoolBusy
+            If the pool is full or the conversion didn't finish within ``timeout`` seconds.
+        """
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise RasterPoolBusy("Too many images are being rendered right now.")
+
+        try:
+            future = self._get_executor().submit(_svg2png, svg.encode("utf-8"), scale)
+        except (BrokenProcessPool, RuntimeError) as e:
+            slots.release()
+            self._reset(e)
+            raise RasterPoolBusy("Image rendering is not available right now.")
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued ones are dropped, running ones will finish in the background
+            future.cancel()
+            raise RasterPoolBusy("Rendering the image took too long.")
+        except BrokenProcessPool as e:
+            self._reset(e)
+            raise RasterPoolBusy("Image rendering is not available right now.")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process full of threads is asking for deadlocks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset(self, error: Exception) -> None:
+        logger.warning(f"Restarting the rasterization pool: {error}")
+        self.shutdown()
+
+
+raster_pool = RasterPool()
@@ -0,0 +1,62 @@
+import copy
+import time
+from typing import Optional
+
+from app.common.bus import event_bus
+from app.common.lru import LRUCache
+
+
+class ActivitySnapshots:
+    """
+    In-process snapshots of the latest activity of every user (and linked service).
+
+    Kept up to date by the ``activity`` events of all workers, so deciding whether
+    the stored activity is fresh enough doesn't need the database (or decrypting
+    tokens). Only a real refresh from the service touches them.
+    """
+
+    def __init__(self, app=None):
+        self.local = LRUCache(maxsize=1024)
+        self._subscribed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.local = LRUCache(
+            maxsize=app.config.get("ACTIVITY_SNAPSHOT_MAX_ENTRIES", 1024)
+        )
+        if not self._subscribed:
+            event_bus.subscribe("activity", self._on_activity)
+            self._subscribed = True
+        app.extensions["activity_snapshots"] = self
+
+    def fresh(self, user_id: int, service: str, max_age: float) -> Optional[dict]:
+        """
+        Return (a copy of) the activity of ``user_id`` on ``service``, if it was
+        stored less than ``max_age`` seconds ago.
+        """
+        snapshot = self.local.get((user_id, service))
+        if snapshot is None:
+            return None
+        data, updated_at = snapshot
+        if time.time() - updated_at >= max_age:
+            return None
+        return copy.deepcopy(data)
+
+    def put(self, user_id: int, service: str, data: dict, updated_at: float) -> None:
+        """Keep ``data`` as the activity of ``user_id`` on ``service``, stored at ``updated_at`` (Unix timestamp)."""
+        snapshot = self.local.get((user_id, service))
+        # Events from other workers may arrive late
+        if snapshot is not None and snapshot[1] > updated_at:
+            return
+        self.local.set((user_id, service), (copy.deepcopy(data), updated_at))
+
+    def _on_activity(self, event: dict) -> None:
+        if event.get("data") is None:
+            # The service was unlinked
+            self.local.delete((event["user_id"], event["service"]))
+            return
+        self.put(event["user_id"], event["service"], event["data"], event["updated_at"])
+
+
+activity_snapshots = ActivitySnapshots()
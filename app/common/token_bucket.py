@@ -0,0 +1,50 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """A thread-safe token bucket, allowing ``rate`` calls per second with bursts of up to ``capacity``.
+
+    Tokens are refilled continuously. ``acquire`` blocks until a token is available,
+    so callers sharing a bucket are spread out instead of bursting past a quota.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Parameters
+        ----------
+        rate : float
+            Number of tokens added per second.
+        capacity : float, optional
+            The maximum number of tokens. Default is ``rate`` (at least 1).
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, waiting (up to ``timeout`` seconds, forever if None) for one.
+
+        Returns True if a token was taken, False if it timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
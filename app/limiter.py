@@ -1,4 +1,3 @@
-import os
 import re
 
 from flask import jsonify, make_response, request
@@ -18,5 +17,5 @@ limiter = Limiter(
     key_func=lambda: request.headers.get("True-Client-Ip", get_remote_address()),
     strategy="fixed-window",
     on_breach=default_error_responder,
-    storage_uri=os.environ.get("REDIS_URI", "memory:///"),
+    # Storage is configured by `create_app`, through `RATELIMIT_STORAGE_URI`
 )
@@ -1,11 +1,11 @@
 from datetime import datetime
 
-import requests
-from flask import render_template, url_for
+from flask import render_template
 
 from app.extensions import sitemapper
 from app.main import bp
 from app.main.forms import SearchForm
+from app.resources.search import YutifySearch
 
 
 @bp.route("/", methods=["GET", "POST"])
@@ -17,13 +17,8 @@ def index():
         artist = form.artist.data
         song = form.song.data
 
-        # Dynamically determine the base URL for the /api/search endpoint
-        base_url = url_for("main.index", _external=True).rstrip("/")
-        search_url = f"{base_url}/api/search/{artist}:{song}"
-
-        # Call the /api/search endpoint using requests
-        response = requests.get(search_url, params={"all": ""})
-        result = response.json()
+        # Same search as `/api/search` (demo included), without the round trip
+        result, _ = YutifySearch().search(artist.strip(), song.strip())
 
         if result.get("error"):
             return render_template(
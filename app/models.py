@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import pickle
 import random
@@ -24,6 +26,7 @@ from flask import current_app
 from flask_security.models import fsqla_v3 as fsqla
 from sqlalchemy.event import listens_for
 
+from app.common.bus import event_bus
 from app.extensions import db
 
 load_dotenv()
@@ -199,6 +202,13 @@ class UserService(Base):
     requested_at: so.Mapped[Optional[float]] = so.mapped_column(
         sa.Float(), nullable=True
     )
+    # When to update the activity next (and how long was waited last), see `app.tasks.activity_updater`
+    next_poll_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True), index=True, nullable=True
+    )
+    poll_interval: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.Integer(), nullable=True
+    )
 
     __table_args__ = (
         sa.UniqueConstraint("user_id", "service_id", name="uq_user_service"),
@@ -236,6 +246,12 @@ class UserData(Base):
         sa.ForeignKey(UserService.id, ondelete="CASCADE"), unique=True
     )
     data: so.Mapped[dict] = so.mapped_column(sa.JSON)
+    # SHA-256 of `data`, to tell whether it changed without comparing it
+    content_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
+    # When `data` was last fetched from the service, even if it didn't change (`updated_at` is when it did)
+    checked_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True)
+    )
 
     # Relationship to UserService: one-to-one
     user_service: so.Mapped["UserService"] = so.relationship(
@@ -243,31 +259,161 @@ class UserData(Base):
     )
 
     @staticmethod
-    def insert_or_update_user_data(user_service, new_data):
-        """Insert or update user data for a given user_service_id."""
-
-        existing_data = db.session.scalar(
-            sa.select(UserData).where(UserData.user_service_id == user_service.id)
-        )
+    def hash_data(data) -> str:
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    @property
+    def last_checked_at(self) -> Optional[datetime]:
+        """When the data was last fetched from the service (changed or not), to tell how fresh it is."""
+        timestamps = [
+            (
+                timestamp.replace(tzinfo=timezone.utc)
+                if timestamp.tzinfo is None
+                else timestamp
+            )
+            for timestamp in (self.updated_at, self.checked_at)
+            if timestamp
+        ]
+        return max(timestamps, default=None)
 
-        if existing_data:
+    @staticmethod
+    def insert_or_update_user_data(user_service, new_data):
+        """
+        Insert or update user data for a given user_service_id.
+
+        If the data didn't change, only ``checked_at`` is updated (without
+        rewriting the data or bumping ``updated_at``).
+        """
+
+        # Already loaded along with the account by batched updates, lazy loaded otherwise
+        existing_data = user_service.user_data
+        content_hash = UserData.hash_data(new_data)
+        now = datetime.now(timezone.utc)
+
+        if existing_data and existing_data.content_hash == content_hash:
+            table = UserData.__table__
+            db.session.execute(
+                sa.update(table).where(table.c.id == existing_data.id)
+                # Keep `updated_at` as is, instead of its `onupdate`
+                .values(checked_at=now, updated_at=table.c.updated_at)
+            )
+            so.attributes.set_committed_value(existing_data, "checked_at", now)
+        elif existing_data:
             existing_data.data = new_data
+            existing_data.content_hash = content_hash
+            existing_data.checked_at = now
             so.attributes.flag_modified(existing_data, "data")
             db.session.add(existing_data)
         else:
             new_entry = UserData(
                 user_service_id=user_service.id,
                 data=new_data,
+                content_hash=content_hash,
+                checked_at=now,
                 user_service=user_service,
             )
             db.session.add(new_entry)
 
         db.session.commit()
+        # Let every worker know, including the activity streams of this user
+        event_bus.publish(
+            "activity",
+            {
+                "user_id": user_service.user_id,
+                "user_service_id": user_service.id,
+                "service": user_service.service.name.lower(),
+                "data": new_data,
+                "updated_at": now.timestamp(),
+            },
+        )
 
     def __repr__(self):
         return f"<UserData: user_service_id={self.user_service_id}, updated_at={self.updated_at}>"
 
 
+class Track(Base):
+    """Track model representing music information gathered from past searches (a local catalog)."""
+
+    __tablename__ = "tracks"
+    id: so.Mapped[int] = so.mapped_column(sa.Integer(), primary_key=True)
+    isrc: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(32), index=True, nullable=True
+    )
+    upc: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32), nullable=True)
+    # Whether the track was found by searching all platforms (without any failures or timeouts)
+    is_complete: so.Mapped[bool] = so.mapped_column(
+        sa.Boolean(), server_default=sa.false(), nullable=False
+    )
+    data: so.Mapped[dict] = so.mapped_column(sa.JSON)
+
+    # Relationship to TrackKey: one-to-many
+    keys: so.Mapped[list["TrackKey"]] = so.relationship(
+        "TrackKey", back_populates="track", cascade="all, delete", uselist=True
+    )
+
+    def __repr__(self):
+        return (
+            f"<Track: id={self.id}, isrc={self.isrc}, is_complete={self.is_complete}>"
+        )
+
+
+class TrackKey(Base):
+    """TrackKey model representing a way to look up a track (ISRC, normalized query or a platform ID)."""
+
+    __tablename__ = "track_keys"
+    id: so.Mapped[int] = so.mapped_column(sa.Integer(), primary_key=True)
+    track_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Track.id, ondelete="CASCADE"), index=True
+    )
+    # "isrc", "query" or a platform name like "spotify"
+    kind: so.Mapped[str] = so.mapped_column(sa.String(32))
+    value: so.Mapped[str] = so.mapped_column(sa.String(512))
+
+    __table_args__ = (sa.UniqueConstraint("kind", "value", name="uq_track_key"),)
+
+    # Relationship: many-to-one
+    track: so.Mapped["Track"] = so.relationship("Track", back_populates="keys")
+
+    def __repr__(self):
+        return f"<TrackKey: {self.kind}={self.value}, track_id={self.track_id}>"
+
+
+class Lyrics(Base):
+    """Lyrics model representing (zlib compressed) lyrics fetched from LRCLIB."""
+
+    __tablename__ = "lyrics"
+    id: so.Mapped[int] = so.mapped_column(sa.Integer(), primary_key=True)
+    # Normalized "artist:song" as it was searched
+    key: so.Mapped[str] = so.mapped_column(sa.String(512), index=True, unique=True)
+    isrc: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(32), index=True, nullable=True
+    )
+    artist_name: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(512), nullable=True
+    )
+    track_name: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(512), nullable=True
+    )
+    instrumental: so.Mapped[bool] = so.mapped_column(
+        sa.Boolean(), server_default=sa.false(), nullable=False
+    )
+    plain: so.Mapped[Optional[bytes]] = so.mapped_column(
+        sa.LargeBinary(), nullable=True
+    )
+    synced: so.Mapped[Optional[bytes]] = so.mapped_column(
+        sa.LargeBinary(), nullable=True
+    )
+    # Packed (start in milliseconds, line number) pairs of the synced lyrics
+    synced_index: so.Mapped[Optional[bytes]] = so.mapped_column(
+        sa.LargeBinary(), nullable=True
+    )
+
+    def __repr__(self):
+        return f"<Lyrics: id={self.id}, key={self.key}, isrc={self.isrc}>"
+
+
 # ==== OAuth 2.0 Related ====
 class OAuth2Client(db.Model, OAuth2ClientMixin):
     __tablename__ = "oauth2_client"
@@ -1,8 +1,8 @@
 from flask import Blueprint
 from flask_restful import Api
 
-from app.resources.search import YutifySearch
-from app.resources.activity import UserActivityResource
+from app.resources.search import YutifySearch, YutifySearchBatch
+from app.resources.activity import UserActivityResource, UserActivityStream
 from app.extensions import csrf
 
 bp = Blueprint("api", __name__)
@@ -10,5 +10,7 @@ api = Api(bp)
 csrf.exempt(bp)
 
 api.add_resource(YutifySearch, "/search/<path:artist>:<path:song>")
+api.add_resource(YutifySearchBatch, "/search/batch")
 api.add_resource(UserActivityResource, "/me", endpoint="useractivityresource")
 api.add_resource(UserActivityResource, "/activity.png", endpoint="activity_png")
+api.add_resource(UserActivityStream, "/me/stream")
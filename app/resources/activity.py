@@ -1,58 +1,72 @@
+import hashlib
+import json
+import logging
 import os
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import cairosvg
 import sqlalchemy as sa
+import sqlalchemy.orm as so
 from authlib.integrations.flask_oauth2 import current_token
-from flask import current_app, make_response, render_template, request
+from flask import (
+    Response,
+    copy_current_request_context,
+    current_app,
+    make_response,
+    render_template,
+    request,
+    stream_with_context,
+)
 from flask_restful import Resource
 from flask_security import Security, SQLAlchemyUserDatastore, current_user
+from werkzeug.http import quote_etag
 
 from app.auth_services.lastfm import get_lastfm_activity
 from app.auth_services.listenbrainz import get_listenbrainz_activity
 from app.auth_services.spotify import get_spotify_activity
-from app.common.helpers import get_album_art_data_uri, get_static_file_data_uri
+from app.common.assets import embed_assets
+from app.common.helpers import get_album_art_data_uri, relative_timestamp
+from app.common.hub import activity_hub
+from app.common.lru import LRUCache
+from app.common.raster import RasterPoolBusy, raster_pool
 from app.extensions import db
 from app.limiter import limiter
-from app.models import UserService
+from app.models import Service, UserData, UserService
+from app.search.fanout import fan_out
 
 RATELIMIT = os.environ.get("RATELIMIT")
 
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+# Rendered (SVG or PNG) activity cards by their fingerprint
+render_cache = LRUCache(maxsize=128, ttl=3600)
+# Last rendered PNG card of every user (and style), served when the rasterization pool is busy
+last_frames = LRUCache(maxsize=256, ttl=24 * 3600)
+RETRY_AFTER = 5  # seconds
+
+# In order of preference, when none of them is playing anything
+ACTIVITY_FETCHERS = {
+    "spotify": get_spotify_activity,
+    "lastfm": get_lastfm_activity,
+    "listenbrainz": get_listenbrainz_activity,
+}
+
+# Slots for the open activity streams, each one holds a server thread for as long as it's open
+_stream_slots = None
+_stream_slots_lock = threading.Lock()
+
 
 class UserActivityResource(Resource):
 
     @limiter.limit(RATELIMIT if RATELIMIT else "")
     def get(self):
         """Fetch the currently playing music for the authenticated user."""
-        username = request.args.get("username", "").strip().lower()
-        security: Security = current_app.security
-        datastore: SQLAlchemyUserDatastore = security.datastore
-
-        if username:
-            # If a username is provided, fetch the user by username
-            user = datastore.find_user(username=username)
-            # If user not found or profile is private
-            if not user or not user.is_profile_public:
-                if current_user.is_authenticated or current_token:
-                    # If the user is authenticated or has a valid OAuth token, allow access
-                    return {"error": "User not found or profile is private."}, 404
-                else:
-                    # User must be authenticated or OAuth token must be valid
-                    return {
-                        "error": "Authentication required. Please log in or provide a valid OAuth token."
-                    }, 401
-        else:
-            # Otherwise, use the current user or the user from the OAuth token
-            user = (
-                current_user
-                if current_user.is_authenticated
-                else current_token.user if current_token else None
-            )
-            if not user:
-                # User must be authenticated or OAuth token must be valid
-                return {
-                    "error": "Authentication required. Please log in or provide a valid OAuth token."
-                }, 401
+        user, error = resolve_user()
+        if error:
+            return error
 
         response_type = request.args.get("type", "json").lower()
         service = request.args.get("service", "all")
@@ -60,10 +74,6 @@ class UserActivityResource(Resource):
         is_svg = "svg" in request.args
         is_png = request.path.endswith(".png")
 
-        favicon_data_uri = get_static_file_data_uri("favicon.svg", "image/svg+xml")
-        no_gif_data_uri = get_static_file_data_uri("errors/no.gif", "image/gif")
-        no_png_data_uri = get_static_file_data_uri("errors/no.png", "image/png")
-
         # Fetch user services from the database
         user_services = db.session.scalars(
             sa.select(UserService).where(UserService.user_id == user.id)
@@ -86,36 +96,8 @@ class UserActivityResource(Resource):
                     200,
                     {"Content-Type": "text/html"},
                 )
-            if is_svg:
-                return make_response(
-                    render_template(
-                        "embed/activity_card.svg.j2",
-                        error=error_msg,
-                        user=user,
-                        no_gif_data_uri=no_gif_data_uri,
-                        style=request.args.get("style"),
-                    ),
-                    200,
-                    {"Content-Type": "image/svg+xml"},
-                )
-            if is_png:
-                # Render SVG first
-                svg_str = render_template(
-                    "embed/activity_card.svg.j2",
-                    error=error_msg,
-                    user=user,
-                    no_gif_data_uri=no_png_data_uri,
-                    style=request.args.get("style"),
-                )
-                # Convert SVG to PNG
-                png_bytes = cairosvg.svg2png(
-                    bytestring=svg_str.encode("utf-8"), scale=2
-                )
-                return make_response(
-                    png_bytes,
-                    200,
-                    {"Content-Type": "image/png"},
-                )
+            if is_svg or is_png:
+                return self._render_card(user, error=error_msg, is_png=is_png)
 
             return {"error": error_msg}, 404
 
@@ -152,9 +134,7 @@ class UserActivityResource(Resource):
             case "listenbrainz":
                 activity = listenbrainz_activity() if listenbrainz_activity else None
             case _:
-                activity = self._fetch_activity(
-                    spotify_activity, lastfm_activity, listenbrainz_activity
-                )
+                activity = self._fetch_activity(user, linked_services, service)
 
         if not activity:
             error_msg = (
@@ -173,36 +153,8 @@ class UserActivityResource(Resource):
                     200,
                     {"Content-Type": "text/html"},
                 )
-            if is_svg:
-                return make_response(
-                    render_template(
-                        "embed/activity_card.svg.j2",
-                        error=error_msg,
-                        user=user,
-                        no_gif_data_uri=no_gif_data_uri,
-                        style=request.args.get("style"),
-                    ),
-                    200,
-                    {"Content-Type": "image/svg+xml"},
-                )
-            if is_png:
-                # Render SVG first
-                svg_str = render_template(
-                    "embed/activity_card.svg.j2",
-                    error=error_msg,
-                    user=user,
-                    no_gif_data_uri=no_png_data_uri,
-                    style=request.args.get("style"),
-                )
-                # Convert SVG to PNG
-                png_bytes = cairosvg.svg2png(
-                    bytestring=svg_str.encode("utf-8"), scale=2
-                )
-                return make_response(
-                    png_bytes,
-                    200,
-                    {"Content-Type": "image/png"},
-                )
+            if is_svg or is_png:
+                return self._render_card(user, error=error_msg, is_png=is_png)
 
             return {"error": error_msg}, 404
 
@@ -218,49 +170,83 @@ class UserActivityResource(Resource):
                 {"Content-Type": "text/html"},
             )
 
-        if is_svg:
-            album_art_data_uri = None
-            if activity and "album_art" in activity.get("music_info", {}):
-                album_art_data_uri = get_album_art_data_uri(
-                    activity["music_info"]["album_art"]
-                )
-            return make_response(
-                render_template(
-                    "embed/activity_card.svg.j2",
-                    activity=activity,
-                    user=user,
-                    album_art_data_uri=album_art_data_uri,
-                    favicon_data_uri=favicon_data_uri,
-                    style=request.args.get("style"),
-                ),
-                200,
-                {"Content-Type": "image/svg+xml"},
-            )
+        if is_svg or is_png:
+            return self._render_card(user, activity=activity, is_png=is_png)
 
-        if is_png:
-            # Render SVG first
-            album_art_data_uri = None
-            if activity and "album_art" in activity.get("music_info", {}):
-                album_art_data_uri = get_album_art_data_uri(
-                    activity["music_info"]["album_art"]
-                )
-            svg_str = render_template(
-                "embed/activity_card.svg.j2",
-                activity=activity,
-                user=user,
-                album_art_data_uri=album_art_data_uri,
-                favicon_data_uri=favicon_data_uri,
-                style=request.args.get("style"),
-            )
-            # Convert SVG to PNG
-            png_bytes = cairosvg.svg2png(bytestring=svg_str.encode("utf-8"), scale=2)
-            return make_response(
-                png_bytes,
-                200,
-                {"Content-Type": "image/png"},
-            )
+        if not isinstance(activity, dict):
+            # e.g. a redirect to re-link the service
+            return activity
 
-        return self._format_response(activity, response_type)
+        # Let clients that already have the same activity skip downloading it again
+        etag = activity_etag(linked_services, activity, response_type)
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+            response.set_etag(etag)
+            return response
+
+        response = self._format_response(activity, response_type)
+        if isinstance(response, dict):
+            return response, 200, {"ETag": quote_etag(etag)}
+        response.set_etag(etag)
+        return response
+
+    def _render_card(self, user, activity=None, error=None, is_png=False):
+        """
+        Render the SVG (or PNG) activity card.
+
+        Rendered cards are cached by a fingerprint of everything shown on them,
+        which is also used as their ``ETag``. So clients that already have the
+        card get a ``304 Not Modified`` without rendering anything.
+        """
+        style = request.args.get("style")
+        fingerprint = card_fingerprint(user, activity, error, style, is_png)
+        mimetype = "image/png" if is_png else "image/svg+xml"
+
+        if request.if_none_match.contains(fingerprint):
+            response = make_response("", 304)
+        else:
+            content = render_cache.get(fingerprint)
+            if content is None:
+                context = {"user": user, "style": style}
+                if activity:
+                    album_art = activity.get("music_info", {}).get("album_art")
+                    context["activity"] = activity
+                    context["album_art_data_uri"] = get_album_art_data_uri(album_art)
+                    context["favicon_data_uri"] = embed_assets.data_uri("favicon.svg")
+                else:
+                    context["error"] = error
+                    context["no_gif_data_uri"] = (
+                        embed_assets.data_uri("errors/no.png")
+                        if is_png
+                        else embed_assets.data_uri("errors/no.gif")
+                    )
+                content = render_template("embed/activity_card.svg.j2", **context)
+                if is_png:
+                    # Convert SVG to PNG (in a separate process)
+                    try:
+                        content = raster_pool.svg2png(content, scale=2)
+                    except RasterPoolBusy as e:
+                        return self._busy_card(user, style, str(e))
+                    last_frames.set((user.username, style), content)
+                render_cache.set(fingerprint, content)
+            response = make_response(content, 200, {"Content-Type": mimetype})
+
+        response.set_etag(fingerprint)
+        # Cards change with the activity, always check if the cached one is still good.
+        # Only in the browser, they might be of a private profile (or an OAuth client)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    def _busy_card(self, user, style, reason):
+        """Serve the last PNG card rendered for the user (if any) when a new one can't be rendered."""
+        frame = last_frames.get((user.username, style))
+        if frame is not None:
+            return make_response(frame, 200, {"Content-Type": "image/png"})
+        return (
+            {"error": f"{reason} Please try again in a few seconds."},
+            503,
+            {"Retry-After": str(RETRY_AFTER)},
+        )
 
     def _format_response(self, activity, response_type):
         """Format the response based on the requested type."""
@@ -274,42 +260,348 @@ class UserActivityResource(Resource):
             return make_response(html, 200, {"Content-Type": "text/html"})
         return activity  # default // json
 
-    def _fetch_activity(
-        self, spotify_activity_func, lastfm_activity_func, listenbrainz_activity_func
-    ):
+    def _fetch_activity(self, user, linked_services, platform="all"):
         """
-        Fetch and prioritize activity from Spotify and Last.fm.
+        Fetch activity from all the linked services at the same time and pick one.
+
+        Each service gets its own timeout. As soon as a service reports music that
+        is currently playing, it's returned without waiting for the rest.
+        Otherwise, if all three services have an activity, a random one is picked,
+        else the first one of Spotify, Last.fm and ListenBrainz.
 
         Parameters
         ----------
-        spotify_activity_func (callable)
-            Function to fetch Spotify activity.
-        lastfm_activity_func (callable)
-            Function to fetch Last.fm activity.
-        listenbrainz_activity_func (callable)
-            Function to fetch ListenBrainz activity.
+        user (User)
+            The user whose activity to fetch.
+        linked_services (dict)
+            The ``UserService`` of every service linked by the user, by name.
+        platform (str)
+            The platform to search the music info on (see ``get_spotify_activity``).
 
         Returns
         -------
         dict
             The selected activity or None if no activity is found.
         """
+        funcs = {
+            name: func
+            for name, func in ACTIVITY_FETCHERS.items()
+            if name in linked_services
+        }
+        if len(funcs) > 1:
+            user_service_ids = {name: linked_services[name].id for name in funcs}
 
-        spotify_activity = spotify_activity_func() if spotify_activity_func else None
-        lastfm_activity = lastfm_activity_func() if lastfm_activity_func else None
-        listenbrainz_activity = (
-            listenbrainz_activity_func() if listenbrainz_activity_func else None
+            def fetch_with(name):
+                def task():
+                    # A new app context (and session), don't share ORM objects across threads
+                    user_service = db.session.scalar(
+                        sa.select(UserService)
+                        .where(UserService.id == user_service_ids[name])
+                        .options(
+                            so.joinedload(UserService.user),
+                            so.joinedload(UserService.service),
+                            so.joinedload(UserService.user_data),
+                        )
+                    )
+                    if user_service is None:
+                        return None
+                    return funcs[name](
+                        user_service.user, platform, user_service=user_service
+                    )
+
+                # Workers need the request (for `current_user`, `url_for`, etc.) as well
+                return copy_current_request_context(task)
+
+            tasks = {name: fetch_with(name) for name in funcs}
+            provider_timeout = current_app.config.get("ACTIVITY_PROVIDER_TIMEOUT", 6)
+            overrides = current_app.config.get("ACTIVITY_PROVIDER_TIMEOUTS", {})
+            # Only of the services the user linked, so they alone set the deadline
+            timeouts = {name: overrides.get(name, provider_timeout) for name in tasks}
+            results, _ = fan_out(
+                tasks,
+                timeouts,
+                global_timeout=max(timeouts.values()),
+                executor=get_activity_executor(
+                    current_app.config.get("ACTIVITY_FETCH_WORKERS", 8)
+                ),
+                stop_when=lambda name, activity: is_playing(activity),
+            )
+        else:
+            results = {
+                name: func(user, platform, user_service=linked_services[name])
+                for name, func in funcs.items()
+            }
+
+        activities = [results[name] for name in funcs if results.get(name)]
+        playing = [activity for activity in activities if is_playing(activity)]
+        if playing:
+            return playing[0]
+        if len(activities) == len(ACTIVITY_FETCHERS):
+            return random.choice(activities)
+        return activities[0] if activities else None
+
+
+class UserActivityStream(Resource):
+
+    @limiter.limit(RATELIMIT if RATELIMIT else "")
+    def get(self):
+        """
+        Stream the listening activity of a user as Server-Sent Events.
+
+        An ``activity`` event is sent whenever the activity changes (and once when
+        connected, unless the ``Last-Event-ID`` is of the current activity), with
+        a heartbeat comment in between to keep the connection open.
+        """
+        user, error = resolve_user()
+        if error:
+            return error
+
+        slots = get_stream_slots(stream_limit(current_app.config))
+        if not slots.acquire(blocking=False):
+            return (
+                {"error": "Too many open activity streams. Please try again later."},
+                503,
+                {"Retry-After": str(RETRY_AFTER)},
+            )
+
+        user_id = user.id
+        heartbeat = current_app.config.get("ACTIVITY_STREAM_HEARTBEAT", 15)
+        max_duration = current_app.config.get("ACTIVITY_STREAM_MAX_DURATION", 300)
+        last_event_id = request.headers.get("Last-Event-ID")
+
+        def events():
+            event_id = last_event_id
+            closes_at = time.monotonic() + max_duration
+            yield f"retry: {RETRY_AFTER * 1000}\n\n"
+            with activity_hub.watch(user_id, poll_activity):
+                version = activity_hub.version(user_id)
+                changed = True
+                while time.monotonic() < closes_at:
+                    if changed:
+                        activity = current_activity(user_id)
+                        data = json.dumps(activity, sort_keys=True, default=str)
+                        new_event_id = hashlib.sha256(data.encode("utf-8")).hexdigest()
+                        if new_event_id != event_id:
+                            event_id = new_event_id
+                            yield f"id: {event_id}\nevent: activity\ndata: {data}\n\n"
+                    timeout = max(min(heartbeat, closes_at - time.monotonic()), 0)
+                    new_version = activity_hub.wait(user_id, version, timeout)
+                    changed, version = new_version != version, new_version
+                    if not changed:
+                        yield ": heartbeat\n\n"
+
+        response = Response(
+            stream_with_context(events()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
+        response.call_on_close(slots.release)
+        return response
+
+
+def poll_activity(user_id: int) -> None:
+    """
+    Fetch the activity of a user from all their linked services (which stores it).
+
+    Runs in the background, without a request: the linked services are loaded
+    here and handed to the fetchers, which raise their errors instead of
+    redirecting (as the scheduled updater expects as well).
+    """
+    user_services = db.session.scalars(
+        sa.select(UserService)
+        .where(UserService.user_id == user_id)
+        .options(
+            so.joinedload(UserService.user),
+            so.joinedload(UserService.service),
+            so.joinedload(UserService.user_data),
+        )
+    ).unique()
+    for user_service in user_services:
+        name = user_service.service.name.lower()
+        if name not in ACTIVITY_FETCHERS:
+            continue
+        try:
+            ACTIVITY_FETCHERS[name](user_service.user, user_service=user_service)
+        except Exception as e:
+            # The other services are still worth a try
+            db.session.rollback()
+            logger.warning(f"Error occurred while polling {name} of {user_id}: {e}")
+
 
-        if spotify_activity and lastfm_activity and listenbrainz_activity:
-            return random.choice(
-                [spotify_activity, lastfm_activity, listenbrainz_activity]
+def current_activity(user_id: int):
+    """
+    Return the stored activity of a user, as sent over the activity stream.
+
+    Music that is currently playing comes first, then Spotify, Last.fm and ListenBrainz.
+    """
+    rows = db.session.execute(
+        sa.select(Service.name, UserData.data)
+        .join(UserService, UserData.user_service_id == UserService.id)
+        .join(Service, UserService.service_id == Service.id)
+        .where(UserService.user_id == user_id)
+        .execution_options(populate_existing=True)
+    ).all()
+    # Don't hold on to a database connection for as long as the stream is open
+    db.session.close()
+
+    activities = {name.lower(): data for name, data in rows if data}
+    ordered = [
+        activities[name]
+        for name in ["spotify", "lastfm", "listenbrainz"]
+        if name in activities
+    ]
+    playing = [activity for activity in ordered if is_playing(activity)]
+    if playing:
+        return playing[0]
+    return ordered[0] if ordered else None
+
+
+def card_fingerprint(user, activity, error, style, is_png) -> str:
+    """Hash everything that is shown on an activity card (and how it's rendered)."""
+    shown = {"user": user.name, "error": error, "style": style, "png": is_png}
+    if activity:
+        activity_info = activity.get("activity_info", {})
+        shown["is_playing"] = bool(activity_info.get("is_playing"))
+        shown["music_info"] = {
+            key: activity.get("music_info", {}).get(key)
+            for key in [
+                "album_art",
+                "album_title",
+                "album_type",
+                "artists",
+                "genre",
+                "title",
+            ]
+        }
+        shown["last_played"] = last_played(activity)
+    return hashlib.sha256(
+        json.dumps(shown, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def resolve_user():
+    """
+    Find the user whose activity is requested.
+
+    That's the user with the ``username`` query parameter (if their profile is public),
+    otherwise the current user or the user of the OAuth token.
+
+    Returns
+    -------
+    tuple
+        The user and None, or None and an error response.
+    """
+    username = request.args.get("username", "").strip().lower()
+    security: Security = current_app.security
+    datastore: SQLAlchemyUserDatastore = security.datastore
+
+    if username:
+        # If a username is provided, fetch the user by username
+        user = datastore.find_user(username=username)
+        # If user not found or profile is private
+        if not user or not user.is_profile_public:
+            if current_user.is_authenticated or current_token:
+                # If the user is authenticated or has a valid OAuth token, allow access
+                return None, ({"error": "User not found or profile is private."}, 404)
+            else:
+                # User must be authenticated or OAuth token must be valid
+                return None, (
+                    {
+                        "error": "Authentication required. Please log in or provide a valid OAuth token."
+                    },
+                    401,
+                )
+    else:
+        # Otherwise, use the current user or the user from the OAuth token
+        user = (
+            current_user
+            if current_user.is_authenticated
+            else current_token.user if current_token else None
+        )
+        if not user:
+            # User must be authenticated or OAuth token must be valid
+            return None, (
+                {
+                    "error": "Authentication required. Please log in or provide a valid OAuth token."
+                },
+                401,
             )
-        elif spotify_activity:
-            return spotify_activity
-        elif lastfm_activity:
-            return lastfm_activity
-        elif listenbrainz_activity:
-            return listenbrainz_activity
+    return user, None
+
 
+def activity_etag(linked_services, activity, response_type) -> str:
+    """
+    Build the ETag of an activity (JSON or HTML) response.
+
+    Derived from when the activity was last updated in the database (by the
+    service it came from) and a hash of the activity itself.
+    """
+    service = linked_services.get(activity.get("activity_info", {}).get("service", ""))
+    user_data = service.user_data if service else None
+    updated_at = (
+        user_data.updated_at.isoformat() if user_data and user_data.updated_at else ""
+    )
+    variant = [
+        response_type,
+        request.headers.get("X-Requested-With"),
+        last_played(activity) if response_type == "html" else None,
+    ]
+    content = json.dumps([variant, activity], sort_keys=True, default=str)
+    return hashlib.sha256(f"{updated_at}:{content}".encode("utf-8")).hexdigest()
+
+
+def last_played(activity) -> str | None:
+    """The "5 minutes ago" shown for music that is not playing anymore, it changes on its own."""
+    timestamp = activity.get("activity_info", {}).get("timestamp")
+    if is_playing(activity) or not timestamp:
         return None
+    return relative_timestamp(int(timestamp))
+
+
+def is_playing(activity) -> bool:
+    """Whether the activity is of music that is currently playing."""
+    return isinstance(activity, dict) and bool(
+        activity.get("activity_info", {}).get("is_playing")
+    )
+
+
+_activity_executor = None
+_activity_executor_lock = threading.Lock()
+
+
+def stream_limit(config) -> int:
+    """
+    Maximum number of open activity streams of this process.
+
+    Every open stream holds one of the ``SERVER_THREADS`` server threads (for up
+    to ``ACTIVITY_STREAM_MAX_DURATION`` seconds), so they never get more than a
+    third of them, whatever ``ACTIVITY_STREAM_MAX_CONNECTIONS`` says.
+    """
+    return max(
+        min(
+            config.get("ACTIVITY_STREAM_MAX_CONNECTIONS", 2),
+            config.get("SERVER_THREADS", 6) // 3,
+        ),
+        0,
+    )
+
+
+def get_stream_slots(max_connections: int = 2) -> threading.BoundedSemaphore:
+    """Return the process-wide semaphore limiting the number of open activity streams."""
+    global _stream_slots
+    with _stream_slots_lock:
+        if _stream_slots is None:
+            _stream_slots = threading.BoundedSemaphore(max_connections)
+        return _stream_slots
+
+
+def get_activity_executor(max_workers: int = 8) -> ThreadPoolExecutor:
+    """Return the process-wide thread pool used for fetching activity from the linked services."""
+    global _activity_executor
+    if _activity_executor is None:
+        with _activity_executor_lock:
+            if _activity_executor is None:
+                _activity_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="yutify-activity"
+                )
+    return _activity_executor
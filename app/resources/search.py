@@ -1,23 +1,30 @@
+import json
 import logging
+import math
 import os
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import asdict
-from typing import Union
-
-import sqlalchemy as sa
-from flask import current_app, make_response, render_template, request
-from flask_restful import Resource, fields, marshal
-from yutipy import deezer, itunes, musicyt, yutipy_music
-from yutipy.exceptions import KKBoxException, SpotifyException
-from yutipy.kkbox import KKBox
+
+from flask import (
+    Response,
+    current_app,
+    g,
+    make_response,
+    render_template,
+    request,
+    stream_with_context,
+)
+from flask_restful import Resource
+from limits import parse_many
 from yutipy.logger import enable_logging
-from yutipy.lrclib import LrcLib
-from yutipy.spotify import Spotify
 
-from app.extensions import cache, db
+from app.common.helpers import is_valid_string
 from app.limiter import limiter
-from app.models import Service
 from app.resources.docs_demo import ALL, DEEZER, ITUNES, KKBOX, SPOTIFY, YTMUSIC
+from app.search.cache import make_key, resolve_platform
+from app.search.service import search_service
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
@@ -26,116 +33,10 @@ enable_logging(level=logging.ERROR)
 RATELIMIT = os.environ.get("RATELIMIT")
 
 
-lyrics_fields = {
-    "instrumental": fields.Boolean,
-    "artistName": fields.String,
-    "trackName": fields.String,
-    "plainLyrics": fields.String,
-    "syncedLyrics": fields.String,
-}
-
-
-class MySpotify(Spotify):
-    """Custom Spotify class to override the `save_access_token` and `load_access_token` methods."""
-
-    SERVICE_NAME = "Spotify"
-    SERVICE_URL = "https://open.spotify.com"
-
-    def __init__(self, *args, app=None, **kwargs):
-        self.app = app or current_app._get_current_object()
-        super().__init__(*args, **kwargs)
-
-    def save_access_token(self, token_info: dict) -> None:
-        with self.app.app_context():
-            service = db.session.scalar(
-                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
-            )
-            if not service:
-                service = Service(
-                    name=self.SERVICE_NAME,
-                    url=self.SERVICE_URL,
-                    is_private=False,
-                )
-                db.session.add(service)  # Add the new service to the session
-
-            # Set the access token values
-            service.access_token = token_info.get("access_token")
-            service.expires_in = token_info.get("expires_in")
-            service.requested_at = token_info.get("requested_at")
-
-            # Commit the changes to the database
-            db.session.commit()
-
-    def load_access_token(self) -> Union[dict, None]:
-        with self.app.app_context():
-            service = db.session.scalar(
-                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
-            )
-
-            if service:
-                return {
-                    "access_token": service.access_token,
-                    "expires_in": service.expires_in,
-                    "requested_at": service.requested_at,
-                }
-        return None
-
-
-class MyKKBox(KKBox):
-    """Custom KKBox class to override the `save_access_token` and `load_access_token` methods."""
-
-    SERVICE_NAME = "KKBox"
-    SERVICE_URL = "https://www.kkbox.com"
-    IS_PRIVATE = True
-
-    def __init__(self, *args, app=None, **kwargs):
-        self.app = app or current_app._get_current_object()
-        super().__init__(*args, **kwargs)
-
-    def save_access_token(self, token_info: dict) -> None:
-        with self.app.app_context():
-            service = db.session.scalar(
-                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
-            )
-            if not service:
-                service = Service(
-                    name=self.SERVICE_NAME,
-                    url=self.SERVICE_URL,
-                    is_private=self.IS_PRIVATE,
-                )
-                db.session.add(service)  # Add the new service to the session
-
-            # Set the access token values
-            service.access_token = token_info.get("access_token")
-            service.expires_in = token_info.get("expires_in")
-            service.requested_at = token_info.get("requested_at")
-
-            # Commit the changes to the database
-            db.session.commit()
-
-    def load_access_token(self) -> Union[dict, None]:
-        with self.app.app_context():
-            service = db.session.scalar(
-                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
-            )
-
-            if service:
-                return {
-                    "access_token": service.access_token,
-                    "expires_in": service.expires_in,
-                    "requested_at": service.requested_at,
-                }
-        return None
-
-
 class YutifySearch(Resource):
     """API resource to search & fetch the song details or lyrics only."""
 
     @limiter.limit(RATELIMIT if RATELIMIT else "")
-    @cache.cached(
-        timeout=3600,  # cache for 1 hour
-        key_prefix=lambda: f"search:{request.view_args['artist'].lower()}:{request.view_args['song'].lower()}:{list(request.args.keys())[0].lower() if request.args else 'all'}",
-    )
     def get(self, artist, song):
         artist = artist.strip()
         song = song.strip()
@@ -143,18 +44,18 @@ class YutifySearch(Resource):
 
         # If only lyrics are requested
         if "lyrics" in request.args:
-            with LrcLib() as lrclib:
-                lyrics_info = lrclib.get_lyrics(artist, song)
-            if lyrics_info:
-                return marshal(lyrics_info, lyrics_fields), 200
-            return {
-                "error": f"Lyrics not found for '{song}' by '{artist}'! You might have to guess the lyrics for this one..."
-            }, 404
+            at = request.args.get("at")
+            if at is not None:
+                try:
+                    at = float(at)
+                except ValueError:
+                    return {"error": "`at` must be a number of seconds."}, 400
+            return search_service.lyrics(artist, song, at=at)
 
         # Check for ?embed param (any value)
         if "embed" in request.args:
             # Always search all platforms for embed (or could respect platform param)
-            result = self.__search_music(artist, song, platform)
+            result = self.search(artist, song, platform)
             # result is (OrderedDict, status_code)
             data, _ = result if isinstance(result, tuple) else (result, 200)
             # Normalize to dict for template
@@ -175,87 +76,169 @@ class YutifySearch(Resource):
             return make_response(html, 200, {"Content-Type": "text/html"})
 
         # Default: JSON response
-        cache_key = f"search:{artist}:{song}:{platform}"  # Construct the cache key
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Cache hit for key: {cache_key}")
+        return self.search(artist, song, platform)
+
+    def search(self, artist, song, platform="all"):
+        """Search for music information, see ``SearchService.search``."""
+        if artist == "Artist" and song == "Song":
+            # Showcased in the documentation, without calling the real platforms
+            return self.demo(resolve_platform(platform))
+        return search_service.search(artist, song, platform)
+
+    def demo(self, platform):
+        if platform == "lyrics":
+            return search_service.lyrics("Artist", "Song")
+        if platform == "deezer":
+            result = asdict(DEEZER)
+        elif platform == "itunes":
+            result = asdict(ITUNES)
+        elif platform == "kkbox":
+            result = asdict(KKBOX)
+        elif platform == "spotify":
+            result = asdict(SPOTIFY)
+        elif platform == "ytmusic":
+            result = asdict(YTMUSIC)
         else:
-            logger.info(f"Cache miss for key: {cache_key}")
+            result = asdict(ALL)
+        return OrderedDict(sorted(result.items())), 200
+
+
+def parse_batch_request() -> tuple[dict, str]:
+    """
+    Parse and dedupe the items of a batch search request.
+
+    Returns
+    -------
+    tuple
+        A mapping of cache key to ``{"artist", "song", "indexes"}`` and the platform.
+
+    Raises
+    ------
+    ValueError
+        If the request body is not valid.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+        raise ValueError(
+            'Request body must be a JSON object with an "items" array of {"artist", "song"} objects.'
+        )
+
+    platform = str(payload.get("platform") or "all").strip().lower()
+    max_items = current_app.config.get("SEARCH_BATCH_MAX_ITEMS", 500)
+    if len(payload["items"]) > max_items:
+        raise ValueError(f"You can search at most {max_items} items at once.")
+
+    unique_items = {}
+    for index, item in enumerate(payload["items"]):
+        artist = item.get("artist") if isinstance(item, dict) else None
+        song = item.get("song") if isinstance(item, dict) else None
+        if not (
+            isinstance(artist, str)
+            and isinstance(song, str)
+            and is_valid_string(artist)
+            and is_valid_string(song)
+        ):
+            raise ValueError(
+                f'Item at index {index} must have non-empty "artist" and "song" strings.'
+            )
+        key = make_key(artist.strip(), song.strip(), platform)
+        unique_items.setdefault(
+            key, {"artist": artist.strip(), "song": song.strip(), "indexes": []}
+        )
+        unique_items[key]["indexes"].append(index)
+
+    return unique_items, platform
+
+
+def get_batch_request() -> tuple[dict, str]:
+    """Same as ``parse_batch_request()``, but parsed only once per request (ratelimit cost and resource)."""
+    if "batch_request" not in g:
+        try:
+            g.batch_request = parse_batch_request()
+        except ValueError as e:
+            g.batch_request = e
+    if isinstance(g.batch_request, ValueError):
+        raise g.batch_request
+    return g.batch_request
+
+
+def batch_cost() -> int:
+    """
+    Charge the ratelimit once per ``SEARCH_BATCH_ITEMS_PER_HIT`` unique items of a batch search.
+
+    Never more than the smallest ratelimit allows, so that batches of up to
+    ``SEARCH_BATCH_MAX_ITEMS`` items can always go through (one at a time).
+    """
+    try:
+        items, _ = get_batch_request()
+    except ValueError:
+        return 1
+    per_hit = current_app.config.get("SEARCH_BATCH_ITEMS_PER_HIT", 25)
+    cost = math.ceil(len(items) / max(per_hit, 1))
+    if RATELIMIT:
+        cost = min(cost, *(limit.amount for limit in parse_many(RATELIMIT)))
+    return max(cost, 1)
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor(max_workers: int = 4) -> ThreadPoolExecutor:
+    """Return the process-wide thread pool used for resolving batch searches."""
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="yutify-batch"
+                )
+    return _batch_executor
 
-        result = self.__search_music(artist, song, platform)
-        return result
 
-    def __search_music(self, artist, song, platform="all"):
-        """Search for music information based on artist, song, and platform."""
-        logger.info("Artist: `%s`, Song: `%s`, Platform: `%s`", artist, song, platform)
+class YutifySearchBatch(Resource):
+    """API resource to search many songs at once, streaming results as NDJSON."""
 
-        if artist == "Artist" and song == "Song":
-            if platform == "deezer":
-                result = asdict(DEEZER)
-            elif platform == "itunes" or platform == "apple-music":
-                result = asdict(ITUNES)
-            elif platform == "kkbox":
-                result = asdict(KKBOX)
-            elif platform == "spotify":
-                result = asdict(SPOTIFY)
-            elif platform == "ytmusic":
-                result = asdict(YTMUSIC)
-            else:
-                result = asdict(ALL)
-            return OrderedDict(sorted(result.items())), 200
-
-        RESULT_LIMIT = 5
-        match platform:
-            case "deezer":
-                with deezer.Deezer() as deezer_music:
-                    result = deezer_music.search(artist, song, limit=RESULT_LIMIT)
-            case "itunes" | "apple-music":
-                with itunes.Itunes() as apple_music:
-                    result = apple_music.search(artist, song, limit=RESULT_LIMIT)
-            case "kkbox":
-                try:
-                    with MyKKBox(defer_load=True) as kkbox_music:
-                        kkbox_music.load_token_after_init()
-                        result = kkbox_music.search(artist, song, limit=RESULT_LIMIT)
-                except KKBoxException as e:
-                    logger.warning(
-                        f"KKBox Search is disabled due to following error:\n{e}"
-                    )
-                    result = None
-            case "spotify":
-                try:
-                    with MySpotify(defer_load=True) as spotify_music:
-                        spotify_music.load_token_after_init()
-                        result = spotify_music.search(artist, song, limit=RESULT_LIMIT)
-                except SpotifyException as e:
-                    logger.warning(
-                        f"Spotify Search is disabled due to following error:\n{e}"
-                    )
-                    result = None
-            case "ytmusic":
-                with musicyt.MusicYT() as youtube_music:
-                    result = youtube_music.search(artist, song, limit=RESULT_LIMIT)
-            case _:
-                with yutipy_music.YutipyMusic(
-                    custom_kkbox_class=lambda *a, **kw: MyKKBox(
-                        *a, app=current_app._get_current_object(), **kw
-                    ),
-                    custom_spotify_class=lambda *a, **kw: MySpotify(
-                        *a, app=current_app._get_current_object(), **kw
-                    ),
-                ) as py_music:
-                    py_music.services["kkbox"].load_token_after_init()
-                    py_music.services["spotify"].load_token_after_init()
-                    result = py_music.search(artist, song, limit=RESULT_LIMIT)
-
-        if not result:
-            msg = (
-                f"Couldn't find '{song}' by '{artist}'"
-                if platform == "all"
-                else f"Couldn't find '{song}' by '{artist}' on platform '{platform.title()}'"
-            )
-            result = {"error": msg}, 404
-        else:
-            result = OrderedDict(sorted(asdict(result).items())), 200
+    @limiter.limit(RATELIMIT if RATELIMIT else "", cost=batch_cost)
+    def post(self):
+        try:
+            items, platform = get_batch_request()
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        app = current_app._get_current_object()
+        executor = get_batch_executor(app.config.get("SEARCH_BATCH_WORKERS", 4))
 
-        return result
+        def resolve(artist, song):
+            with app.app_context():
+                return YutifySearch().search(artist, song, platform)
+
+        def generate():
+            futures = {
+                executor.submit(resolve, item["artist"], item["song"]): item
+                for item in items.values()
+            }
+            try:
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        data, status = future.result()
+                    except Exception as e:
+                        logger.warning(
+                            f"Batch search failed for '{item['song']}' by '{item['artist']}': {e}"
+                        )
+                        data, status = {"error": "Something went wrong!"}, 500
+                    line = {**item, "platform": platform, "status": status}
+                    if status == 200:
+                        line["result"] = data
+                    else:
+                        line["error"] = data.get("error")
+                    yield json.dumps(line) + "\n"
+            finally:
+                # Client went away, don't resolve the rest for nobody
+                for future in futures:
+                    future.cancel()
+
+        return Response(
+            stream_with_context(generate()), 200, mimetype="application/x-ndjson"
+        )
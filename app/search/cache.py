@@ -0,0 +1,229 @@
+import copy
+import logging
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from flask import current_app
+
+from app.common.bus import event_bus
+from app.common.coalesce import single_flight
+from app.common.lru import LRUCache
+from app.extensions import cache
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+PLATFORMS = {
+    "apple-music": "itunes",
+    "deezer": "deezer",
+    "itunes": "itunes",
+    "kkbox": "kkbox",
+    "lyrics": "lyrics",
+    "spotify": "spotify",
+    "ytmusic": "ytmusic",
+}
+
+# Dropped instead of being replaced by a space, so "Don't" matches "Dont"
+APOSTROPHES = {"'", "\u2019", "`"}
+
+# "Song (feat. Someone)", "Song [ft. Someone]"
+BRACKETED_FEATURING = re.compile(
+    r"[\(\[]\s*(?:feat|ft|featuring)\b[^\)\]]*[\)\]]", re.IGNORECASE
+)
+# "Artist feat. Someone", "Artist ft Someone"
+TRAILING_FEATURING = re.compile(r"\s(?:feat|ft|featuring)\b.*$", re.IGNORECASE)
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize an artist or song name so near-identical queries share a cache entry.
+
+    Applies Unicode NFKC normalization, case folding, strips "feat." clauses
+    and punctuation and collapses whitespace.
+
+    Example: ``"  Madeon  feat. Someone"`` & ``"madeon"`` -> ``"madeon"``.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = BRACKETED_FEATURING.sub(" ", text)
+    text = TRAILING_FEATURING.sub("", text)
+    text = "".join(char for char in text if char not in APOSTROPHES)
+    text = "".join(
+        " " if unicodedata.category(char).startswith("P") else char for char in text
+    )
+    return " ".join(text.casefold().split())
+
+
+def resolve_platform(platform: str) -> str:
+    """Map the requested platform to the canonical platform name, ``"all"`` if unknown."""
+    return PLATFORMS.get((platform or "").lower(), "all")
+
+
+def make_key(artist: str, song: str, platform: str = "all") -> str:
+    """Build the cache key for a search."""
+    return f"search:{resolve_platform(platform)}:{normalize_query(artist)}:{normalize_query(song)}"
+
+
+class SearchCache:
+    """
+    Two-tier cache for search results.
+
+    A size-bounded in-process LRU (L1) sits in front of the app's cache backend (L2),
+    which is Redis in production. L1 works even when L2 is disabled (``NullCache``).
+    Results that were not found ("negative" entries) and partial results
+    are cached as well, but only for a short while.
+
+    Expired results are kept for another ``stale_ttl`` seconds. During that time,
+    ``get_or_set`` serves them right away (stale-while-revalidate) and refreshes
+    them in the background.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 3600
+        self.negative_ttl = 300
+        self.stale_ttl = 3600
+        self.max_refreshes = 4
+        self.local = LRUCache(maxsize=1024, ttl=self.ttl + self.stale_ttl)
+        self._executor = None
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self._state = threading.local()
+        self._subscribed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("SEARCH_CACHE_TTL", self.ttl)
+        self.negative_ttl = app.config.get(
+            "SEARCH_CACHE_NEGATIVE_TTL", self.negative_ttl
+        )
+        self.stale_ttl = app.config.get("SEARCH_CACHE_STALE_TTL", self.stale_ttl)
+        self.max_refreshes = app.config.get(
+            "SEARCH_CACHE_MAX_REFRESHES", self.max_refreshes
+        )
+        self.local = LRUCache(
+            maxsize=app.config.get("SEARCH_CACHE_MAX_ENTRIES", 1024),
+            ttl=self.ttl + self.stale_ttl,
+        )
+        if not self._subscribed:
+            # Results replaced by other workers, L2 already has the new one
+            event_bus.subscribe(
+                "search_cache.invalidate", lambda event: self.local.delete(event["key"])
+            )
+            self._subscribed = True
+        app.extensions["search_cache"] = self
+
+    def timeout_for(self, result: tuple) -> int:
+        """How long to keep a ``(body, status_code)`` search result."""
+        body, status = result
+        if status != 200 or (isinstance(body, dict) and body.get("timed_out")):
+            return self.negative_ttl
+        return self.ttl
+
+    def get(self, key: str, stale: bool = False):
+        """
+        Return the cached ``(body, status_code)`` for ``key`` or None.
+
+        Expired results (still within the staleness window) are only returned if ``stale`` is True.
+        """
+        item = self._get_item(key)
+        if item is not None and (stale or item["fresh_until"] > time.time()):
+            logger.info(f"Cache hit for key: {key}")
+            return copy.deepcopy(item["result"])
+
+        logger.info(f"Cache miss for key: {key}")
+        return None
+
+    def set(self, key: str, result: tuple) -> None:
+        """Cache the ``(body, status_code)`` search result in both tiers."""
+        timeout = self.timeout_for(result)
+        item = {"result": result, "fresh_until": time.time() + timeout}
+        self.local.set(key, item, ttl=timeout + self.stale_ttl)
+        cache.set(key, item, timeout=timeout + self.stale_ttl)
+        # Not to ourselves, that would evict the result we just cached
+        event_bus.broadcast("search_cache.invalidate", {"key": key})
+
+    def delete(self, key: str) -> None:
+        """Remove ``key`` from both tiers."""
+        self.local.delete(key)
+        cache.delete(key)
+        event_bus.broadcast("search_cache.invalidate", {"key": key})
+
+    def get_or_set(self, key: str, producer: Callable[[], tuple]) -> tuple:
+        """
+        Return the cached result for ``key``, calling ``producer`` to fill it on a miss.
+
+        Concurrent misses for the same key are coalesced, only one of them calls ``producer``.
+        Expired results are returned as is while ``producer`` refreshes them in the background.
+        """
+        item = self._get_item(key)
+        if item is not None:
+            if item["fresh_until"] <= time.time():
+                self._revalidate(key, producer)
+            logger.info(f"Cache hit for key: {key}")
+            return copy.deepcopy(item["result"])
+
+        logger.info(f"Cache miss for key: {key}")
+        return single_flight.do(key, lambda: self._produce(key, producer))
+
+    def revalidating(self) -> bool:
+        """Whether the current thread is refreshing a stale result in the background."""
+        return getattr(self._state, "revalidating", False)
+
+    def _get_item(self, key: str):
+        item = self.local.get(key)
+        if item is None:
+            item = cache.get(key)
+            if item is not None and not isinstance(item, dict):
+                # Cached before results had a freshness, good as new
+                item = {
+                    "result": item,
+                    "fresh_until": time.time() + self.timeout_for(item),
+                }
+            if item is not None:
+                # Promote to L1 for the rest of its lifetime, not a whole new one
+                remaining = max(item["fresh_until"] - time.time(), 0)
+                self.local.set(key, item, ttl=remaining + self.stale_ttl)
+        return item
+
+    def _produce(self, key: str, producer: Callable[[], tuple]) -> tuple:
+        # Might have been filled while waiting for another process to finish
+        result = self.get(key)
+        if result is None:
+            result = producer()
+            self.set(key, result)
+        return result
+
+    def _revalidate(self, key: str, producer: Callable[[], tuple]) -> None:
+        """Refresh ``key`` in the background, unless it's already being refreshed or too many refreshes are running."""
+        with self._refreshing_lock:
+            if key in self._refreshing or len(self._refreshing) >= self.max_refreshes:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_refreshes, thread_name_prefix="yutify-refresh"
+                )
+
+        app = current_app._get_current_object()
+
+        def refresh():
+            self._state.revalidating = True
+            try:
+                with app.app_context():
+                    single_flight.do(key, lambda: self._produce(key, producer))
+            except Exception as e:
+                logger.warning(f"Error occurred while refreshing key {key}: {e}")
+            finally:
+                self._state.revalidating = False
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        logger.info(f"Serving stale result while refreshing key: {key}")
+        self._executor.submit(refresh)
+
+
+search_cache = SearchCache()
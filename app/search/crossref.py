@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import time
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import db
+from app.models import Track, TrackKey
+from app.search.cache import normalize_query
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+# Length of `TrackKey.value`
+MAX_KEY_LENGTH = 512
+
+
+def query_key(artist: str, song: str) -> str:
+    """Build the normalized ``artist:song`` lookup key."""
+    return f"{normalize_query(artist)}:{normalize_query(song)}"
+
+
+def key_value(value) -> str:
+    """The value of a key as stored, longer ones are replaced by their hash to fit."""
+    value = str(value)
+    if len(value) > MAX_KEY_LENGTH:
+        return f"sha256:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+    return value
+
+
+def is_fresh(track: Track, entry: str) -> bool:
+    """Whether ``entry`` (``"merged"`` or a platform) of ``track`` was indexed less than ``SEARCH_INDEX_TTL`` ago."""
+    indexed_at = track.data.get("indexed_at", {}).get(entry)
+    ttl = current_app.config.get("SEARCH_INDEX_TTL", 7 * 24 * 3600)
+    return indexed_at is not None and time.time() - indexed_at < ttl
+
+
+def find_track(kind: str, value) -> Optional[Track]:
+    """Find an indexed track by one of its keys."""
+    if not value:
+        return None
+    return db.session.scalar(
+        sa.select(Track)
+        .join(TrackKey)
+        .where(TrackKey.kind == kind, TrackKey.value == key_value(value))
+    )
+
+
+def lookup(artist: str, song: str, platform: str = "all") -> Optional[dict]:
+    """
+    Answer a search from the index, if it has a confident match.
+
+    A search of all platforms is only answered by tracks that were found on
+    all platforms before (without any of them failing or timing out), a single
+    platform search only if the track was found on that platform before. Either
+    way, only within ``SEARCH_INDEX_TTL`` seconds.
+
+    Returns
+    -------
+    dict | None
+        The search result in the same shape as the search API response.
+    """
+    track = find_track("query", query_key(artist, song))
+    if not track:
+        return None
+
+    merged = track.data.get("merged")
+    if platform == "all":
+        if track.is_complete and merged and is_fresh(track, "merged"):
+            return dict(merged)
+        return None
+
+    result = track.data.get("platforms", {}).get(platform)
+    if not result or not is_fresh(track, platform):
+        return None
+    result = dict(result)
+    if not result.get("lyrics") and merged:
+        result["lyrics"] = merged.get("lyrics")
+    return result
+
+
+def lookup_platform_id(platform: str, platform_id) -> Optional[dict]:
+    """Find the (all platforms) search result of a track by its ID on one platform."""
+    track = find_track(platform, platform_id)
+    if (
+        track
+        and track.is_complete
+        and track.data.get("merged")
+        and is_fresh(track, "merged")
+    ):
+        return dict(track.data["merged"])
+    return None
+
+
+def record(
+    artist: str,
+    song: str,
+    merged: Optional[dict],
+    platforms: dict[str, dict],
+    complete: bool = False,
+) -> None:
+    """
+    Add a successful search to the index (or update the already indexed track).
+
+    Parameters
+    ----------
+    artist (str)
+        The artist as it was searched.
+    song (str)
+        The song as it was searched.
+    merged (dict, optional)
+        The merged result of all platforms, if all platforms were searched.
+    platforms (dict)
+        Mapping of platform name to the result of that platform.
+    complete (bool)
+        Whether all platforms were searched without any of them failing or timing out.
+    """
+    if not merged and not platforms:
+        return
+
+    main = merged or next(iter(platforms.values()))
+    keys = {("query", query_key(artist, song))}
+    if main.get("artists") and main.get("title"):
+        keys.add(("query", query_key(main["artists"], main["title"])))
+    if main.get("isrc"):
+        keys.add(("isrc", main["isrc"]))
+    for name, result in platforms.items():
+        if result.get("id"):
+            keys.add((name, str(result["id"])))
+    keys = {(kind, key_value(value)) for kind, value in keys if value}
+
+    try:
+        track = None
+        for kind, value in sorted(keys):
+            track = find_track(kind, value)
+            if track:
+                break
+
+        if track and main.get("isrc") and track.isrc and track.isrc != main["isrc"]:
+            # Same name, but a different recording. Don't mix them up.
+            logger.info(
+                f"Not indexing '{song}' by '{artist}', ISRC {main['isrc']} doesn't match indexed track {track.id}"
+            )
+            return
+
+        if not track:
+            track = Track(data={"merged": None, "platforms": {}})
+            db.session.add(track)
+
+        now = time.time()
+        data = {
+            "merged": track.data.get("merged"),
+            "platforms": dict(track.data.get("platforms", {})),
+            "indexed_at": dict(track.data.get("indexed_at", {})),
+        }
+        data["platforms"].update(platforms)
+        data["indexed_at"].update({name: now for name in platforms})
+        if merged and (
+            complete or not track.is_complete or not is_fresh(track, "merged")
+        ):
+            data["merged"] = merged
+            data["indexed_at"]["merged"] = now
+            # Replaced by a partial result once the complete one got stale
+            track.is_complete = complete
+        track.data = data
+        track.isrc = track.isrc or main.get("isrc")
+        track.upc = track.upc or main.get("upc")
+
+        existing = {(key.kind, key.value) for key in track.keys}
+        for kind, value in keys - existing:
+            if not find_track(kind, value):
+                track.keys.append(TrackKey(kind=kind, value=value))
+
+        db.session.commit()
+    except SQLAlchemyError as e:
+        # Most likely a concurrent search indexed the same track, nothing lost
+        db.session.rollback()
+        logger.warning(f"Could not index '{song}' by '{artist}': {e}")
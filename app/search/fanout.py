@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from yutipy.models import MusicInfo, MusicInfos
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ["deezer", "itunes", "kkbox", "spotify", "ytmusic"]
+
+# Order in which provider results are merged. The first available one
+# overwrites the common attributes, the rest only fill in the gaps.
+MERGE_PRIORITY = ["spotify", "deezer", "kkbox", "itunes", "ytmusic"]
+# Same as yutipy's, where Spotify's album art always takes precedence
+ALBUM_ART_PRIORITY = ["spotify", "deezer", "kkbox", "ytmusic", "itunes"]
+MERGED_ATTRIBUTES = [
+    "album_title",
+    "album_type",
+    "artists",
+    "genre",
+    "isrc",
+    "lyrics",
+    "release_date",
+    "tempo",
+    "title",
+    "type",
+    "upc",
+]
+
+# How often tasks waiting for a worker are checked on (in seconds)
+QUEUED_POLL_INTERVAL = 0.05
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers: int = 16) -> ThreadPoolExecutor:
+    """Return the process-wide, bounded thread pool used for provider lookups."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="yutify-fanout"
+                )
+    return _executor
+
+
+def fan_out(
+    tasks: dict[str, Callable],
+    timeouts: dict[str, float],
+    global_timeout: float,
+    executor: ThreadPoolExecutor = None,
+    stop_when: Callable[[str, object], bool] = None,
+) -> tuple[dict, list[str]]:
+    """
+    Run every task at the same time and collect whatever finishes in time.
+
+    Parameters
+    ----------
+    tasks (dict)
+        Mapping of provider name to a callable taking no arguments.
+    timeouts (dict)
+        Mapping of provider name to its own deadline (in seconds), counted from
+        when its task starts running (not while it waits for a worker).
+    global_timeout (float)
+        Deadline for the whole fan-out (in seconds). No provider is waited
+        on longer than this, regardless of its own deadline.
+    executor (ThreadPoolExecutor, optional)
+        Pool to run the tasks on. Defaults to the shared fan-out pool.
+    stop_when (callable, optional)
+        Called with the provider name and result of every completed task.
+        If it returns True, the results so far are returned right away
+        without waiting for the remaining tasks (which are not reported as timed out).
+
+    Returns
+    -------
+    tuple
+        A mapping of provider name to its result (for the providers that
+        completed without error) and a sorted list of the providers that
+        did not complete before their deadline.
+    """
+    executor = executor or get_executor()
+    started = time.monotonic()
+    global_deadline = started + global_timeout
+    started_at = {}
+
+    def timed(name, task):
+        def run():
+            started_at[name] = time.monotonic()
+            return task()
+
+        return run
+
+    futures = {executor.submit(timed(name, task)): name for name, task in tasks.items()}
+
+    def deadline(future):
+        name = futures[future]
+        if name not in started_at:
+            # Still waiting for a worker
+            return global_deadline
+        return min(
+            started_at[name] + timeouts.get(name, global_timeout), global_deadline
+        )
+
+    results = {}
+    timed_out = []
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        expired = {future for future in pending if deadline(future) <= now}
+        for future in expired:
+            # Running futures can't be interrupted, they just get abandoned
+            future.cancel()
+            timed_out.append(futures[future])
+        pending -= expired
+        if not pending:
+            break
+
+        next_deadline = min(deadline(future) for future in pending)
+        if any(futures[future] not in started_at for future in pending):
+            # Their deadline is only known once they start
+            next_deadline = min(next_deadline, now + QUEUED_POLL_INTERVAL)
+        done, pending = wait(
+            pending, timeout=next_deadline - now, return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.warning(f"Error occurred while searching with {name}: {e}")
+                continue
+            if stop_when and stop_when(name, results[name]):
+                for abandoned in pending:
+                    abandoned.cancel()
+                pending = set()
+                break
+
+    if timed_out:
+        logger.warning(
+            f"Provider(s) timed out after {time.monotonic() - started:.2f}s: {', '.join(sorted(timed_out))}"
+        )
+    return results, sorted(timed_out)
+
+
+def merge_results(results: dict[str, Optional[MusicInfo]]) -> Optional[MusicInfos]:
+    """
+    Merge the results of individual providers into a single ``MusicInfos``.
+
+    Results are merged in a fixed order (see ``MERGE_PRIORITY``) so the response
+    doesn't depend on which provider happened to answer first.
+    """
+    music_info = MusicInfos()
+    available = [name for name in MERGE_PRIORITY if results.get(name)]
+    if not available:
+        return None
+
+    highest_priority = available[0]
+    for name in available:
+        result = results[name]
+        if name == highest_priority:
+            for attr in MERGED_ATTRIBUTES:
+                setattr(music_info, attr, getattr(result, attr))
+        else:
+            for attr in MERGED_ATTRIBUTES:
+                if getattr(result, attr) and (
+                    not getattr(music_info, attr)
+                    or (attr in ["genre", "album_type"] and name == "itunes")
+                ):
+                    setattr(music_info, attr, getattr(result, attr))
+
+        music_info.id[name] = result.id
+        music_info.url[name] = result.url
+
+    for name in ALBUM_ART_PRIORITY:
+        if results.get(name) and results[name].album_art:
+            music_info.album_art = results[name].album_art
+            music_info.album_art_source = name
+            break
+
+    return music_info
@@ -0,0 +1,197 @@
+import logging
+import re
+import zlib
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.common.lru import LRUCache
+from app.extensions import db
+from app.models import Lyrics
+from app.search.crossref import key_value, query_key
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+# One or more "[mm:ss.xx]" timestamps at the start of a line of synced lyrics
+LEADING_TIMESTAMPS = re.compile(r"^((?:\s*\[\d+:\d+(?:[.:]\d+)?\])+)(.*)$")
+TIMESTAMP = re.compile(r"\[(\d+):(\d+)(?:[.:](\d+))?\]")
+
+# Length of `Lyrics.artist_name` and `Lyrics.track_name`
+MAX_NAME_LENGTH = 512
+
+
+def compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8")) if text else None
+
+
+def decompress(data: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(data).decode("utf-8") if data else None
+
+
+def build_index(synced: Optional[str]) -> bytes:
+    """
+    Build the timestamp index of synced lyrics.
+
+    The index is an array of unsigned 32-bit integers of alternating start time
+    (in milliseconds) and line number, sorted by start time. A line with more
+    than one timestamp (e.g. a repeated chorus) appears once per timestamp.
+    """
+    entries = []
+    for number, line in enumerate((synced or "").splitlines()):
+        match = LEADING_TIMESTAMPS.match(line)
+        if not match:
+            continue
+        for minutes, seconds, fraction in TIMESTAMP.findall(match.group(1)):
+            start = (int(minutes) * 60 + int(seconds)) * 1000
+            if fraction:
+                start += int(fraction.ljust(3, "0")[:3])
+            entries.append((start, number))
+
+    index = array("I")
+    for start, number in sorted(entries):
+        index.extend((start, number))
+    return index.tobytes()
+
+
+class LyricsEntry:
+    """Lyrics of a song with their pre-parsed timestamp index."""
+
+    def __init__(self, info: dict, index: bytes, updated_at: datetime = None):
+        self.info = info
+        self.updated_at = updated_at
+        packed = array("I")
+        packed.frombytes(index or b"")
+        self.starts = packed[0::2]
+        self.numbers = packed[1::2]
+        self._lines = None
+
+    @classmethod
+    def from_info(cls, info: dict) -> "LyricsEntry":
+        return cls(info, build_index(info.get("syncedLyrics")))
+
+    def line_at(self, seconds: float) -> Optional[dict]:
+        """
+        Return the line of synced lyrics being sung at ``seconds`` into the song.
+
+        Returns
+        -------
+        dict | None
+            The ``start`` & ``end`` (in seconds, ``end`` is None for the last line)
+            and ``text`` of the line, or None if there are no synced lyrics or the
+            first line hasn't started yet.
+        """
+        position = bisect_right(self.starts, int(seconds * 1000)) - 1
+        if position < 0:
+            return None
+
+        if self._lines is None:
+            self._lines = (self.info.get("syncedLyrics") or "").splitlines()
+        match = LEADING_TIMESTAMPS.match(self._lines[self.numbers[position]])
+        end = (
+            self.starts[position + 1] / 1000
+            if position + 1 < len(self.starts)
+            else None
+        )
+        return {
+            "start": self.starts[position] / 1000,
+            "end": end,
+            "text": match.group(2).strip() if match else "",
+        }
+
+
+class LyricsStore:
+    """
+    Long-lived store of lyrics (in the database) in front of LRCLIB.
+
+    Lyrics are saved compressed, keyed by the normalized artist and song they
+    were searched by and the ISRC of the song (when known). Recently used lyrics
+    are also kept decoded in memory.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 30 * 24 * 3600
+        self.local = LRUCache(maxsize=256)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("LYRICS_STORE_TTL", self.ttl)
+        self.local = LRUCache(maxsize=app.config.get("LYRICS_STORE_MAX_ENTRIES", 256))
+        app.extensions["lyrics_store"] = self
+
+    def is_fresh(self, entry: LyricsEntry) -> bool:
+        updated_at = entry.updated_at
+        if updated_at is None:
+            return True
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - updated_at < timedelta(seconds=self.ttl)
+
+    def get(
+        self, artist: str, song: str, isrc: str = None, stale: bool = False
+    ) -> Optional[LyricsEntry]:
+        """
+        Return the stored lyrics of a song, by artist and song or else by ISRC.
+
+        Lyrics older than ``LYRICS_STORE_TTL`` are only returned if ``stale`` is True.
+        """
+        # Stored the same way as the keys of the track index
+        key = key_value(query_key(artist, song))
+        entry = self.local.get(key)
+        if entry is None:
+            row = db.session.scalar(sa.select(Lyrics).where(Lyrics.key == key))
+            if row is None and isrc:
+                row = db.session.scalar(
+                    sa.select(Lyrics)
+                    .where(Lyrics.isrc == isrc)
+                    .order_by(Lyrics.updated_at.desc())
+                    .limit(1)
+                )
+            if row is None:
+                return None
+            entry = self._entry(row)
+            self.local.set(key, entry)
+
+        if stale or self.is_fresh(entry):
+            return entry
+        return None
+
+    def save(self, artist: str, song: str, info: dict, isrc: str = None) -> None:
+        """Save the lyrics (as returned by LRCLIB) of a song."""
+        key = key_value(query_key(artist, song))
+        try:
+            row = db.session.scalar(sa.select(Lyrics).where(Lyrics.key == key))
+            if row is None:
+                row = Lyrics(key=key)
+                db.session.add(row)
+            row.isrc = isrc or row.isrc
+            row.artist_name = (info.get("artistName") or "")[:MAX_NAME_LENGTH] or None
+            row.track_name = (info.get("trackName") or "")[:MAX_NAME_LENGTH] or None
+            row.instrumental = bool(info.get("instrumental"))
+            row.plain = compress(info.get("plainLyrics"))
+            row.synced = compress(info.get("syncedLyrics"))
+            row.synced_index = build_index(info.get("syncedLyrics"))
+            db.session.commit()
+            self.local.set(key, self._entry(row))
+        except SQLAlchemyError as e:
+            # Most likely a concurrent request saved the same lyrics, nothing lost
+            db.session.rollback()
+            logger.warning(f"Could not save lyrics of '{song}' by '{artist}': {e}")
+
+    def _entry(self, row: Lyrics) -> LyricsEntry:
+        info = {
+            "instrumental": row.instrumental,
+            "artistName": row.artist_name,
+            "trackName": row.track_name,
+            "plainLyrics": decompress(row.plain),
+            "syncedLyrics": decompress(row.synced),
+        }
+        return LyricsEntry(info, row.synced_index, updated_at=row.updated_at)
+
+
+lyrics_store = LyricsStore()
@@ -0,0 +1,368 @@
+import logging
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Union
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_restful import fields, marshal
+from yutipy import deezer, itunes, musicyt
+from yutipy.kkbox import KKBox
+from yutipy.lrclib import LrcLib
+from yutipy.models import MusicInfo
+from yutipy.spotify import Spotify
+
+from app.common.clients import client_registry
+from app.extensions import db
+from app.models import Service
+from app.search import crossref
+from app.search.cache import make_key, resolve_platform, search_cache
+from app.search.fanout import PROVIDERS, fan_out, get_executor, merge_results
+from app.search.lyrics import LyricsEntry, lyrics_store
+from app.search.tokens import SharedTokenMixin
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+
+lyrics_fields = {
+    "instrumental": fields.Boolean,
+    "artistName": fields.String,
+    "trackName": fields.String,
+    "plainLyrics": fields.String,
+    "syncedLyrics": fields.String,
+}
+
+
+class MySpotify(SharedTokenMixin, Spotify):
+    """Custom Spotify class to override the `save_access_token` and `load_access_token` methods."""
+
+    SERVICE_NAME = "Spotify"
+    SERVICE_URL = "https://open.spotify.com"
+
+    def __init__(self, *args, app=None, **kwargs):
+        self.app = app or current_app._get_current_object()
+        super().__init__(*args, **kwargs)
+
+    def save_access_token(self, token_info: dict) -> None:
+        with self.app.app_context():
+            service = db.session.scalar(
+                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
+            )
+            if not service:
+                service = Service(
+                    name=self.SERVICE_NAME,
+                    url=self.SERVICE_URL,
+                    is_private=False,
+                )
+                db.session.add(service)  # Add the new service to the session
+
+            # Set the access token values
+            service.access_token = token_info.get("access_token")
+            service.expires_in = token_info.get("expires_in")
+            service.requested_at = token_info.get("requested_at")
+
+            # Commit the changes to the database
+            db.session.commit()
+
+    def load_access_token(self) -> Union[dict, None]:
+        with self.app.app_context():
+            service = db.session.scalar(
+                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
+            )
+
+            if service:
+                return {
+                    "access_token": service.access_token,
+                    "expires_in": service.expires_in,
+                    "requested_at": service.requested_at,
+                }
+        return None
+
+
+class MyKKBox(SharedTokenMixin, KKBox):
+    """Custom KKBox class to override the `save_access_token` and `load_access_token` methods."""
+
+    SERVICE_NAME = "KKBox"
+    SERVICE_URL = "https://www.kkbox.com"
+    IS_PRIVATE = True
+
+    def __init__(self, *args, app=None, **kwargs):
+        self.app = app or current_app._get_current_object()
+        super().__init__(*args, **kwargs)
+
+    def save_access_token(self, token_info: dict) -> None:
+        with self.app.app_context():
+            service = db.session.scalar(
+                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
+            )
+            if not service:
+                service = Service(
+                    name=self.SERVICE_NAME,
+                    url=self.SERVICE_URL,
+                    is_private=self.IS_PRIVATE,
+                )
+                db.session.add(service)  # Add the new service to the session
+
+            # Set the access token values
+            service.access_token = token_info.get("access_token")
+            service.expires_in = token_info.get("expires_in")
+            service.requested_at = token_info.get("requested_at")
+
+            # Commit the changes to the database
+            db.session.commit()
+
+    def load_access_token(self) -> Union[dict, None]:
+        with self.app.app_context():
+            service = db.session.scalar(
+                sa.select(Service).where(Service.name.ilike(self.SERVICE_NAME.lower()))
+            )
+
+            if service:
+                return {
+                    "access_token": service.access_token,
+                    "expires_in": service.expires_in,
+                    "requested_at": service.requested_at,
+                }
+        return None
+
+
+# Provider clients are pooled (and reused) across requests, see `app.common.clients`
+client_registry.register("deezer", lambda app: deezer.Deezer(fetch_lyrics=False))
+client_registry.register("itunes", lambda app: itunes.Itunes(fetch_lyrics=False))
+client_registry.register("kkbox", lambda app: MyKKBox(fetch_lyrics=False, app=app))
+client_registry.register("spotify", lambda app: MySpotify(fetch_lyrics=False, app=app))
+client_registry.register("ytmusic", lambda app: musicyt.MusicYT(fetch_lyrics=False))
+client_registry.register("lyrics", lambda app: LrcLib())
+
+
+class ProviderError(Exception):
+    """A platform failed to answer a search (e.g. it's rate limited or down)."""
+
+
+class SearchService:
+    """
+    Search for music information and lyrics, in-process.
+
+    Shared by the search API, the home page and the activity of linked services,
+    so they all go through the same caches (and coalescing) without calling the
+    API over HTTP. Results are ``(body, status_code)`` tuples, as returned by the API.
+    Needs an app context.
+    """
+
+    def search(self, artist, song, platform="all"):
+        """Search for music information, serving repeated lookups from the search cache."""
+        platform = resolve_platform(platform)
+        if platform == "lyrics":
+            return self.lyrics(artist, song)
+        if platform != "all":
+            # Assembled from the per-platform entry (of the same key), along with
+            # the lyrics, so the response is cached under a key of its own
+            return search_cache.get_or_set(
+                f"{make_key(artist, song, platform)}:response",
+                lambda: self.__search_music(artist, song, platform),
+            )
+        return search_cache.get_or_set(
+            make_key(artist, song, platform),
+            lambda: self.__search_music(artist, song, platform),
+        )
+
+    def lyrics(self, artist, song, at=None):
+        """
+        Fetch the lyrics of a song, serving repeated lookups from the search cache.
+
+        If ``at`` (in seconds) is given, only the line of the synced lyrics
+        being sung at that time is returned.
+        """
+        result = search_cache.get_or_set(
+            make_key(artist, song, "lyrics"),
+            lambda: self.__search_lyrics(artist, song),
+        )
+        if at is None or result[1] != 200:
+            return result
+
+        data = result[0]
+        entry = lyrics_store.get(artist, song, stale=True) or LyricsEntry.from_info(
+            data
+        )
+        return {
+            "instrumental": data.get("instrumental"),
+            "artistName": data.get("artistName"),
+            "trackName": data.get("trackName"),
+            "at": at,
+            "line": entry.line_at(at),
+        }, 200
+
+    def __search_lyrics(self, artist, song):
+        """Fetch the lyrics of a song from the lyrics store or else, LRCLIB."""
+        stored = lyrics_store.get(artist, song, stale=True)
+        if stored and lyrics_store.is_fresh(stored):
+            return self.__lyrics_response(artist, song, stored.info)
+
+        with client_registry.borrow("lyrics") as lrclib:
+            lyrics_info = lrclib.get_lyrics(artist, song)
+        if lyrics_info:
+            lyrics_store.save(artist, song, lyrics_info)
+        elif stored:
+            # Outdated lyrics are better than no lyrics
+            lyrics_info = stored.info
+        return self.__lyrics_response(artist, song, lyrics_info)
+
+    def __lyrics_response(self, artist, song, lyrics_info):
+        if lyrics_info:
+            return marshal(lyrics_info, lyrics_fields), 200
+        return {
+            "error": f"Lyrics not found for '{song}' by '{artist}'! You might have to guess the lyrics for this one..."
+        }, 404
+
+    def __platform_response(self, artist, song, platform, result):
+        if not result:
+            return {
+                "error": f"Couldn't find '{song}' by '{artist}' on platform '{platform.title()}'"
+            }, 404
+        return OrderedDict(sorted(asdict(result).items())), 200
+
+    def __search_music(self, artist, song, platform="all"):
+        """
+        Search for music information based on artist, song, and platform.
+
+        Every platform's result is cached on its own, so searching all platforms
+        only queries the platforms that are not cached yet and a single platform
+        search can be answered from an earlier search of all platforms (and vice versa).
+        """
+        logger.info("Artist: `%s`, Song: `%s`, Platform: `%s`", artist, song, platform)
+
+        platforms = PROVIDERS if platform == "all" else [platform]
+        results = {}
+        missing = []
+        for name in platforms:
+            cached = search_cache.get(make_key(artist, song, name))
+            if cached is None:
+                missing.append(name)
+            elif cached[1] == 200:
+                results[name] = MusicInfo(**cached[0])
+
+        # Refreshes of stale results go to the platforms, the index might be just as stale
+        if missing and not search_cache.revalidating():
+            indexed = crossref.lookup(artist, song, platform)
+            if indexed:
+                logger.info(f"Found '{song}' by '{artist}' in the local index.")
+                return OrderedDict(sorted(indexed.items())), 200
+
+        lyrics = search_cache.get(make_key(artist, song, "lyrics"))
+        if lyrics is None:
+            stored = lyrics_store.get(artist, song)
+            if stored:
+                lyrics = self.__lyrics_response(artist, song, stored.info)
+                search_cache.set(make_key(artist, song, "lyrics"), lyrics)
+
+        fetched = {}
+        timed_out = []
+        if missing or lyrics is None:
+            fetched, timed_out = self.__search_platforms(
+                artist, song, missing, with_lyrics=lyrics is None
+            )
+            # Platforms that errored out or timed out are not in `fetched`, don't cache those
+            for name in missing:
+                if name in fetched:
+                    search_cache.set(
+                        make_key(artist, song, name),
+                        self.__platform_response(artist, song, name, fetched[name]),
+                    )
+                    if fetched[name]:
+                        results[name] = fetched[name]
+            if "lyrics" in fetched:
+                lyrics = self.__lyrics_response(artist, song, fetched["lyrics"])
+                search_cache.set(make_key(artist, song, "lyrics"), lyrics)
+
+        result = merge_results(results) if platform == "all" else results.get(platform)
+        isrc = result.isrc if result else None
+        if fetched.get("lyrics"):
+            lyrics_store.save(artist, song, fetched["lyrics"], isrc=isrc)
+        elif isrc and (lyrics is None or lyrics[1] != 200):
+            # Might be known by another name, e.g. "Song (Remastered)"
+            stored = lyrics_store.get(artist, song, isrc=isrc)
+            if stored:
+                lyrics = self.__lyrics_response(artist, song, stored.info)
+                search_cache.set(make_key(artist, song, "lyrics"), lyrics)
+
+        if result and not result.lyrics and lyrics and lyrics[1] == 200:
+            result.lyrics = lyrics[0].get("plainLyrics")
+
+        if missing and result:
+            crossref.record(
+                artist,
+                song,
+                merged=asdict(result) if platform == "all" else None,
+                platforms={name: asdict(info) for name, info in results.items()},
+                # Every platform answered, without errors or timing out
+                complete=platform == "all" and all(name in fetched for name in missing),
+            )
+
+        if not result:
+            msg = (
+                f"Couldn't find '{song}' by '{artist}'"
+                if platform == "all"
+                else f"Couldn't find '{song}' by '{artist}' on platform '{platform.title()}'"
+            )
+            result = {"error": msg}
+            if timed_out:
+                result["timed_out"] = timed_out
+            result = result, 404
+        else:
+            result = asdict(result)
+            if timed_out:
+                result["timed_out"] = timed_out
+            result = OrderedDict(sorted(result.items())), 200
+
+        return result
+
+    def __search_platforms(self, artist, song, platforms, with_lyrics=True, limit=5):
+        """
+        Search the given platforms (and LRCLIB for lyrics) at the same time.
+
+        Each provider gets its own deadline and the whole search is bounded by a
+        global one, so a single slow provider can't hold up the whole response.
+
+        Returns
+        -------
+        tuple
+            A mapping of platform name (and ``"lyrics"``) to its result (None if
+            nothing was found) and a list of platforms that timed out. Platforms
+            that are unavailable or failed (see ``ProviderError``) are left out of both.
+        """
+        app = current_app._get_current_object()
+
+        def search_with(name):
+            def task():
+                with client_registry.borrow(name) as client:
+                    errors = client.http_errors
+                    result = client.search(artist, song, limit=limit)
+                    failed = result is None and client.http_errors > errors
+                if failed:
+                    # Not the same as not found, leave it out of the results
+                    raise ProviderError(f"Request to {name} failed.")
+                return result
+
+            return task
+
+        def get_lyrics():
+            with client_registry.borrow("lyrics") as lrclib:
+                return lrclib.get_lyrics(artist, song)
+
+        tasks = {name: search_with(name) for name in platforms}
+        if with_lyrics:
+            tasks["lyrics"] = get_lyrics
+
+        provider_timeout = app.config.get("SEARCH_PROVIDER_TIMEOUT", 5)
+        timeouts = {name: provider_timeout for name in tasks}
+        timeouts.update(app.config.get("SEARCH_PROVIDER_TIMEOUTS", {}))
+        return fan_out(
+            tasks,
+            timeouts,
+            global_timeout=app.config.get("SEARCH_GLOBAL_TIMEOUT", 8),
+            executor=get_executor(app.config.get("SEARCH_FANOUT_WORKERS", 16)),
+        )
+
+
+search_service = SearchService()
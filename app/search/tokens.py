@@ -0,0 +1,124 @@
+import logging
+import threading
+from time import time
+from typing import Callable, Optional
+
+# Create a logger for this module
+logger = logging.getLogger(__name__)
+
+# Refresh the access tokens this many seconds before they actually expire
+REFRESH_MARGIN = 60
+
+
+def is_fresh(token_info: Optional[dict], margin: float = REFRESH_MARGIN) -> bool:
+    """Whether ``token_info`` has an access token that is valid for at least ``margin`` more seconds."""
+    if not token_info or not token_info.get("access_token"):
+        return False
+    try:
+        expires_at = token_info["requested_at"] + token_info["expires_in"]
+    except (KeyError, TypeError):
+        return False
+    return expires_at - margin > time()
+
+
+class TokenStore:
+    """
+    Process-wide, in-memory store of client credentials access tokens (e.g. Spotify's & KKBox's).
+
+    Tokens are loaded from the database once and then served from memory until
+    shortly before they expire. Only one thread refreshes an expired token
+    (single-flight), everyone else waits for it and reuses the new one.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        name: str,
+        load: Callable[[], Optional[dict]],
+        fetch: Callable[[], dict],
+        save: Callable[[dict], None],
+    ) -> dict:
+        """
+        Return a valid access token for the service ``name``.
+
+        Parameters
+        ----------
+        name (str)
+            Name of the service the token belongs to.
+        load (callable)
+            Loads the persisted token info, only called when no token is in memory yet.
+        fetch (callable)
+            Requests a new token info from the service.
+        save (callable)
+            Persists a newly fetched token info.
+        """
+        token_info = self._tokens.get(name)
+        if is_fresh(token_info):
+            return token_info
+
+        with self._lock_for(name):
+            # Someone else might have refreshed it while we were waiting
+            token_info = self._tokens.get(name)
+            if is_fresh(token_info):
+                return token_info
+
+            if token_info is None:
+                token_info = load()
+            if not is_fresh(token_info):
+                logger.info(f"Requesting a new access token for {name}.")
+                token_info = fetch()
+                save(token_info)
+
+            self._tokens[name] = token_info
+            return token_info
+
+    def invalidate(self, name: str) -> None:
+        """Forget the in-memory token of the service ``name``."""
+        self._tokens.pop(name, None)
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+
+token_store = TokenStore()
+
+
+class SharedTokenMixin:
+    """
+    Mixin for yutipy clients (using client credentials flow) to share their access token through ``token_store``.
+
+    The client's ``load_access_token`` and ``save_access_token`` are only used to
+    load the token from and persist it to the database, the rest of the time it's
+    served from memory. Must come before the yutipy client in the bases.
+    """
+
+    def load_token_after_init(self) -> None:
+        self._use_token(self._shared_token())
+
+    def _refresh_access_token(self) -> None:
+        if not is_fresh(
+            {
+                "access_token": self._access_token,
+                "expires_in": self._token_expires_in,
+                "requested_at": self._token_requested_at,
+            }
+        ):
+            self._use_token(self._shared_token())
+
+    def _shared_token(self) -> dict:
+        return token_store.get(
+            self.SERVICE_NAME,
+            load=self.load_access_token,
+            fetch=self._get_access_token,
+            save=self.save_access_token,
+        )
+
+    def _use_token(self, token_info: dict) -> None:
+        self._access_token = token_info.get("access_token")
+        self._token_expires_in = token_info.get("expires_in")
+        self._token_requested_at = token_info.get("requested_at")
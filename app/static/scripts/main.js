@@ -545,8 +545,36 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
+    // Get notified of activity changes instead of polling, when the browser supports it
+    function startActivityStream() {
+        const activityContainer = document.querySelector('.user-activity-container') || document.querySelector('#user-activity');
+        if (!activityContainer || !window.EventSource) {
+            return false;
+        }
+
+        let url = '/api/me/stream';
+        const username = document.getElementById('username').getAttribute('data-username');
+        if (username) {
+            url += `?username=${encodeURIComponent(username)}`;
+        }
+
+        const stream = new EventSource(url);
+        stream.addEventListener('activity', () => {
+            fetchActivity().catch(() => {});
+        });
+        stream.addEventListener('error', () => {
+            // The browser reconnects on its own, unless the server refused the stream
+            if (stream.readyState === EventSource.CLOSED) {
+                startFetchingActivity();
+            }
+        });
+        return true;
+    }
+
     // Start the fetching process
-    startFetchingActivity();
+    if (!startActivityStream()) {
+        startFetchingActivity();
+    }
 
     if (accountDelBtm) {
         const showDelAccount = document.querySelector('#show-account-del');
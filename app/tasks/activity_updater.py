@@ -1,53 +1,324 @@
+import atexit
+import heapq
 import logging
+import math
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Optional
 
+import sqlalchemy as sa
+import sqlalchemy.orm as so
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from app import db
 from app.auth_services.lastfm import get_lastfm_activity
+from app.auth_services.listenbrainz import get_listenbrainz_activity
 from app.auth_services.spotify import get_spotify_activity
-from app.models import UserService
+from app.common.lease import Leadership
+from app.common.snapshots import activity_snapshots
+from app.common.token_bucket import TokenBucket
+from app.models import Service, UserService
 
 logger = logging.getLogger(__name__)
 
-ACTIVITY_UPDATE_INTERVAL = 10  # in minutes
+# How often due accounts are picked up and the queue is reloaded from the database (in seconds)
+SCHEDULER_TICK = 15
+SCHEDULER_RELOAD = 5 * 60
 
+# Time between updates of an account (in seconds), depending on its activity
+PLAYING_INTERVAL = (30, 60)  # Currently playing, picked at random in between
+ACTIVE_INTERVAL = 5 * 60  # Played something within the last `ACTIVE_WITHIN`
+ACTIVE_WITHIN = 60 * 60
+IDLE_MIN_INTERVAL = 10 * 60  # Doubled on every update with no new activity...
+IDLE_MAX_INTERVAL = 6 * 60 * 60  # ...up to this
+# Due accounts updated this recently (e.g. by an activity stream) are not fetched again,
+# well below `PLAYING_INTERVAL`, so playing accounts keep their cadence
+RECENTLY_UPDATED = 10
 
-def update_all_user_activities(app):
+UPDATERS = {
+    "spotify": get_spotify_activity,
+    "lastfm": get_lastfm_activity,
+    "listenbrainz": get_listenbrainz_activity,
+}
+
+# Request budget of every service, shared by all runs (and workers) of this process
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(app, service: str) -> TokenBucket:
+    """Return the token bucket limiting the requests made to ``service`` by the updater."""
+    with _buckets_lock:
+        if service not in _buckets:
+            rate = app.config.get("ACTIVITY_UPDATE_RATES", {}).get(
+                service, app.config.get("ACTIVITY_UPDATE_RATE", 2)
+            )
+            _buckets[service] = TokenBucket(rate)
+        return _buckets[service]
+
+
+def update_user_activities(app, accounts: list[tuple[int, str]]) -> tuple[dict, set]:
+    """
+    Update the activity of a chunk of linked accounts, one after another.
+
+    The accounts (with their user, service and stored activity) are loaded
+    with a single query and handed to the fetchers as is.
+
+    Parameters
+    ----------
+    accounts (list)
+        ``(user_service_id, service)`` of the accounts to update.
+
+    Returns
+    -------
+    tuple
+        The activity of every updated account by its ``user_service_id`` (None
+        if there is none) and the ``user_service_id`` of the accounts that failed.
+    """
+    activities = {}
+    failed = set()
     with app.app_context():
-        started = time.time()
-        logger.info("[ActivityUpdater] Starting scheduled user activity update...")
-        user_services = db.session.query(UserService).all()
+        # Keep the chunk loaded while every account commits its own activity
+        db.session().expire_on_commit = False
+        user_services = db.session.scalars(
+            sa.select(UserService)
+            .where(UserService.id.in_([account[0] for account in accounts]))
+            .options(
+                so.joinedload(UserService.user),
+                so.joinedload(UserService.service),
+                so.joinedload(UserService.user_data),
+            )
+        ).unique()
+        user_services = {
+            user_service.id: user_service for user_service in user_services
+        }
 
-        for user_service in user_services:
-            user = user_service.user
-            service = user_service.service.name.lower()
-            try:
-                if service == "spotify":
-                    get_spotify_activity(user)
-                elif service == "lastfm":
-                    get_lastfm_activity(user)
+        for user_service_id, service in accounts:
+            user_service = user_services.get(user_service_id)
+            if user_service is None:
+                # Unlinked in the meantime
+                activities[user_service_id] = None
+                continue
 
-                time.sleep(2)  # Stagger requests to avoid bursts
+            # Wait for our turn, instead of a fixed delay between all requests
+            get_bucket(app, service).acquire()
+            try:
+                # It's due, whether the stored activity looks fresh or not
+                activity = UPDATERS[service](
+                    user_service.user, force_refresh=True, user_service=user_service
+                )
             except Exception as e:
+                db.session.rollback()
+                failed.add(user_service_id)
                 logger.error(
-                    f"[ActivityUpdater] Error updating {service} for {user.username}: {e}"
+                    f"[ActivityUpdater] Error updating {service} for user {user_service.user_id}: {e}"
+                )
+                continue
+            # e.g. a redirect to re-link the service
+            activities[user_service_id] = (
+                activity if isinstance(activity, dict) else None
+            )
+    return activities, failed
+
+
+def next_interval(activity: Optional[dict], previous: Optional[int]) -> int:
+    """
+    How long (in seconds) to wait before updating an account again.
+
+    Accounts playing music right now are updated every 30-60 seconds, ones that
+    played something recently every few minutes. Otherwise, the interval is
+    doubled every time, from ``IDLE_MIN_INTERVAL`` up to ``IDLE_MAX_INTERVAL``.
+    """
+    activity_info = (activity or {}).get("activity_info") or {}
+    if activity_info.get("is_playing"):
+        return random.randint(*PLAYING_INTERVAL)
+
+    timestamp = activity_info.get("timestamp")
+    if timestamp and time.time() - float(timestamp) < ACTIVE_WITHIN:
+        return ACTIVE_INTERVAL
+
+    return min(max((previous or 0) * 2, IDLE_MIN_INTERVAL), IDLE_MAX_INTERVAL)
+
+
+class ActivityScheduler:
+    """
+    Priority queue of linked accounts, by when their activity is to be updated next.
+
+    Every ``SCHEDULER_TICK`` seconds, the accounts that are due are updated and
+    rescheduled (see ``next_interval``). The schedule is saved in the database,
+    so it survives restarts, and reloaded every ``SCHEDULER_RELOAD`` seconds to
+    pick up accounts that were linked or unlinked in the meantime.
+
+    With several processes (or nodes), only the leader (see ``Leadership``)
+    updates accounts. The others stand by and take over when it's gone.
+    """
+
+    def __init__(self, app, leadership: Optional[Leadership] = None):
+        self.app = app
+        self.leadership = leadership
+        self._queue = []
+        self._loaded_at = 0
+        if leadership is not None:
+            # The schedule was saved by the previous leader in the meantime
+            leadership.on_elected(self.invalidate)
+
+    def invalidate(self) -> None:
+        """Reload the queue from the database on the next run."""
+        self._loaded_at = 0
+
+    def reload(self) -> None:
+        now = time.time()
+        queue = []
+        chunk_size = self.app.config.get("ACTIVITY_UPDATE_CHUNK_SIZE", 100)
+        last_id = 0
+        while True:
+            # Keyset pagination, no matter how many accounts there are
+            with self.app.app_context():
+                rows = db.session.execute(
+                    sa.select(
+                        UserService.id,
+                        UserService.user_id,
+                        Service.name,
+                        UserService.next_poll_at,
+                        UserService.poll_interval,
+                    )
+                    .join(Service)
+                    .where(UserService.id > last_id)
+                    .order_by(UserService.id)
+                    .limit(chunk_size)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            for user_service_id, user_id, name, next_poll_at, poll_interval in rows:
+                if name.lower() not in UPDATERS:
+                    continue
+                if next_poll_at is None:
+                    # Never scheduled (e.g. just linked), due right away
+                    due = now
+                elif next_poll_at.tzinfo is None:
+                    due = next_poll_at.replace(tzinfo=timezone.utc).timestamp()
+                else:
+                    due = next_poll_at.timestamp()
+                queue.append(
+                    (due, user_service_id, user_id, name.lower(), poll_interval)
                 )
+        heapq.heapify(queue)
+        self._queue = queue
+        self._loaded_at = now
+
+    def run_due(self) -> None:
+        """Update (and reschedule) the accounts that are due."""
+        if self.leadership is not None and not self.leadership.is_leader:
+            return
 
-        total_time = time.time() - started
-        minutes, seconds = divmod(total_time, 60)
+        if time.time() - self._loaded_at >= SCHEDULER_RELOAD:
+            self.reload()
+
+        now = time.time()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue))
+        if not due:
+            return
+
+        started = time.time()
+        schedule = []
+        failed = set()
+        activities = {}
+        to_update = []
+        for _, user_service_id, user_id, service, _ in due:
+            activity = activity_snapshots.fresh(user_id, service, RECENTLY_UPDATED)
+            if activity is not None:
+                # Just updated, no need to load anything
+                activities[user_service_id] = activity
+            else:
+                to_update.append((user_service_id, service))
+
+        if to_update:
+            workers = self.app.config.get("ACTIVITY_UPDATE_WORKERS", 4)
+            # Spread the accounts over the workers, in chunks of at most `ACTIVITY_UPDATE_CHUNK_SIZE`
+            chunk_size = min(
+                self.app.config.get("ACTIVITY_UPDATE_CHUNK_SIZE", 100),
+                math.ceil(len(to_update) / workers),
+            )
+            chunks = [
+                to_update[i : i + chunk_size]
+                for i in range(0, len(to_update), chunk_size)
+            ]
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="yutify-updater"
+            ) as executor:
+                futures = {
+                    executor.submit(update_user_activities, self.app, chunk): chunk
+                    for chunk in chunks
+                }
+                for future in as_completed(futures):
+                    try:
+                        chunk_activities, chunk_failed = future.result()
+                    except Exception as e:
+                        logger.error(f"[ActivityUpdater] Error updating accounts: {e}")
+                        chunk_activities = {}
+                        chunk_failed = {account[0] for account in futures[future]}
+                    activities.update(chunk_activities)
+                    failed |= chunk_failed
+
+        for _, user_service_id, user_id, service, poll_interval in due:
+            # Failed ones back off, just like an idle account
+            interval = next_interval(activities.get(user_service_id), poll_interval)
+            due_at = time.time() + interval
+            heapq.heappush(
+                self._queue, (due_at, user_service_id, user_id, service, interval)
+            )
+            schedule.append(
+                {
+                    "b_id": user_service_id,
+                    "b_next_poll_at": datetime.fromtimestamp(due_at, timezone.utc),
+                    "b_poll_interval": interval,
+                }
+            )
+
+        self.save(schedule)
         logger.info(
-                f"Activity update took: {int(minutes)} minutes and {seconds:.2f} seconds."
+            f"[ActivityUpdater] Updated {len(due)} accounts ({len(failed)} failed) "
+            f"in {time.time() - started:.2f} seconds."
         )
 
+    def save(self, schedule: list[dict]) -> None:
+        with self.app.app_context():
+            # Accounts unlinked in the meantime are simply not updated
+            db.session.execute(
+                sa.update(UserService.__table__)
+                .where(UserService.__table__.c.id == sa.bindparam("b_id"))
+                .values(
+                    next_poll_at=sa.bindparam("b_next_poll_at"),
+                    poll_interval=sa.bindparam("b_poll_interval"),
+                ),
+                schedule,
+            )
+            db.session.commit()
+
 
 def start_activity_scheduler(app):
+    leadership = Leadership(name="yutify:activity-scheduler")
+    with app.app_context():
+        leadership.init_app(app, engine=db.engine)
+    activity_scheduler = ActivityScheduler(app, leadership)
+    leadership.start()
+    # Let another process take over right away
+    atexit.register(leadership.stop)
+
     scheduler = BackgroundScheduler()
     scheduler.add_job(
-        update_all_user_activities,
+        activity_scheduler.run_due,
         "interval",
-        minutes=ACTIVITY_UPDATE_INTERVAL,
-        args=[app],
+        seconds=SCHEDULER_TICK,
+        max_instances=1,
+        coalesce=True,
     )
     scheduler.start()
     logger.info("[ActivityUpdater] Scheduler started.")
@@ -20,6 +20,73 @@ class Config:
         int(os.getenv("YUTIFY_ACCOUNT_DELETE_EMAIL", True))
     )
 
+    # Searching all platforms at once (timeouts are in seconds)
+    SEARCH_GLOBAL_TIMEOUT = float(os.getenv("SEARCH_GLOBAL_TIMEOUT", 8))
+    SEARCH_PROVIDER_TIMEOUT = float(os.getenv("SEARCH_PROVIDER_TIMEOUT", 5))
+    SEARCH_PROVIDER_TIMEOUTS = {"ytmusic": 6, "lyrics": 4}
+    SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", 16))
+
+    # Fetching activity from all linked services at once (timeouts are in seconds)
+    ACTIVITY_PROVIDER_TIMEOUT = float(os.getenv("ACTIVITY_PROVIDER_TIMEOUT", 6))
+    # Spotify activity might need a search of all platforms as well
+    ACTIVITY_PROVIDER_TIMEOUTS = {"spotify": 10}
+    ACTIVITY_FETCH_WORKERS = int(os.getenv("ACTIVITY_FETCH_WORKERS", 8))
+    # Scheduled activity updates, rates are requests per second (per service)
+    ACTIVITY_UPDATE_WORKERS = int(os.getenv("ACTIVITY_UPDATE_WORKERS", 4))
+    ACTIVITY_UPDATE_RATE = float(os.getenv("ACTIVITY_UPDATE_RATE", 2))
+    ACTIVITY_UPDATE_CHUNK_SIZE = int(os.getenv("ACTIVITY_UPDATE_CHUNK_SIZE", 100))
+    # Last.fm allows 5 requests per second
+    ACTIVITY_UPDATE_RATES = {"lastfm": 4}
+    # Only one process runs the scheduled updates, the others take over within this many seconds when it's gone
+    SCHEDULER_LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", 60))
+    # Latest activity of users kept in memory of each process
+    ACTIVITY_SNAPSHOT_MAX_ENTRIES = int(
+        os.getenv("ACTIVITY_SNAPSHOT_MAX_ENTRIES", 1024)
+    )
+
+    # Redis pub/sub channel used to broadcast events (e.g. activity updates) between workers
+    EVENT_BUS_CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "yutify:events")
+
+    # Activity stream (`/api/me/stream`), durations are in seconds
+    ACTIVITY_STREAM_MAX_CONNECTIONS = int(
+        os.getenv("ACTIVITY_STREAM_MAX_CONNECTIONS", 2)
+    )
+    ACTIVITY_STREAM_HEARTBEAT = float(os.getenv("ACTIVITY_STREAM_HEARTBEAT", 15))
+    ACTIVITY_STREAM_MAX_DURATION = float(os.getenv("ACTIVITY_STREAM_MAX_DURATION", 300))
+    ACTIVITY_STREAM_POLL_INTERVAL = float(
+        os.getenv("ACTIVITY_STREAM_POLL_INTERVAL", 15)
+    )
+
+    # Rendering PNG activity cards (timeout is in seconds)
+    RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", 2))
+    RASTER_MAX_QUEUE = int(os.getenv("RASTER_MAX_QUEUE", 4))
+    RASTER_TIMEOUT = float(os.getenv("RASTER_TIMEOUT", 10))
+
+    # Pooled provider (Deezer, Last.fm, etc.) clients, max age is in seconds
+    PROVIDER_CLIENT_POOL_SIZE = int(os.getenv("PROVIDER_CLIENT_POOL_SIZE", 4))
+    PROVIDER_CLIENT_MAX_AGE = int(os.getenv("PROVIDER_CLIENT_MAX_AGE", 600))
+    # Of every HTTP request made by those clients (in seconds)
+    PROVIDER_HTTP_TIMEOUT = float(os.getenv("PROVIDER_HTTP_TIMEOUT", 5))
+
+    # Search result cache (timeouts are in seconds)
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3600))
+    SEARCH_CACHE_NEGATIVE_TTL = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 300))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 1024))
+    SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", 3600))
+    SEARCH_CACHE_MAX_REFRESHES = int(os.getenv("SEARCH_CACHE_MAX_REFRESHES", 4))
+    SEARCH_COALESCE_TIMEOUT = float(os.getenv("SEARCH_COALESCE_TIMEOUT", 10))
+    # Tracks indexed from past searches (in seconds)
+    SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", 7 * 24 * 3600))
+
+    # Lyrics store (TTL is in seconds)
+    LYRICS_STORE_TTL = int(os.getenv("LYRICS_STORE_TTL", 30 * 24 * 3600))
+    LYRICS_STORE_MAX_ENTRIES = int(os.getenv("LYRICS_STORE_MAX_ENTRIES", 256))
+
+    # Batch search (`POST /api/search/batch`)
+    SEARCH_BATCH_MAX_ITEMS = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", 500))
+    SEARCH_BATCH_WORKERS = int(os.getenv("SEARCH_BATCH_WORKERS", 4))
+    SEARCH_BATCH_ITEMS_PER_HIT = int(os.getenv("SEARCH_BATCH_ITEMS_PER_HIT", 25))
+
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "lax"
@@ -39,6 +106,7 @@ class Config:
     MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
     ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
     PORT = os.getenv("PORT", 5000)
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", 6))
     LOG_TO_STDOUT = bool(int(os.getenv("LOG_TO_STDOUT", True)))
 
     # Only set these config variables if custom captcha solution used
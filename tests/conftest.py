@@ -0,0 +1,6 @@
+import os
+
+from cryptography.fernet import Fernet
+
+# Needed to import the models, which the app modules do
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
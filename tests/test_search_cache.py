@@ -0,0 +1,59 @@
+from flask import Flask
+
+from app.common.bus import EventBus, LocalBroker, event_bus
+from app.extensions import cache
+from app.search.cache import SearchCache
+
+
+def make_app():
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "NullCache"})
+    if event_bus.broker is None:
+        event_bus.attach(LocalBroker())
+    return app
+
+
+def test_set_then_get_hits_local_cache():
+    app = make_app()
+    search_cache = SearchCache(app)
+    with app.app_context():
+        search_cache.set("search:all:madeon:shelter", ({"title": "Shelter"}, 200))
+
+        assert "search:all:madeon:shelter" in search_cache.local
+        assert search_cache.get("search:all:madeon:shelter") == (
+            {"title": "Shelter"},
+            200,
+        )
+
+
+def test_get_or_set_calls_producer_once():
+    app = make_app()
+    search_cache = SearchCache(app)
+    calls = []
+
+    def producer():
+        calls.append(1)
+        return {"error": "Not found"}, 404
+
+    with app.app_context():
+        for _ in range(2):
+            assert search_cache.get_or_set("search:all:nobody:nothing", producer) == (
+                {"error": "Not found"},
+                404,
+            )
+
+    assert len(calls) == 1
+
+
+def test_invalidation_reaches_other_workers_only():
+    app = make_app()
+    search_cache = SearchCache(app)
+    other = EventBus(broker=event_bus.broker)
+    received = []
+    other.subscribe("search_cache.invalidate", received.append)
+
+    with app.app_context():
+        search_cache.set("search:all:madeon:shelter", ({"title": "Shelter"}, 200))
+
+        assert received == [{"key": "search:all:madeon:shelter"}]
+        assert search_cache.get("search:all:madeon:shelter") is not None
@@ -69,7 +69,11 @@ def set_security_headers(response):
     is_activity = request.path.startswith("/api/me") or request.path.startswith("/api/activity.png")
 
     if is_profile or is_activity:
-        response.headers["Cache-Control"] = "no-store"
+        # Activity cards with an ETag may be stored (by the browser only), but must be revalidated
+        if is_activity and response.get_etag()[0]:
+            response.headers["Cache-Control"] = "private, no-cache"
+        else:
+            response.headers["Cache-Control"] = "no-store"
 
     return response
 
@@ -84,7 +88,7 @@ if __name__ == "__main__":
         app,
         host="0.0.0.0",
         port=app.config["PORT"],
-        threads=6,
+        threads=app.config["SERVER_THREADS"],
         url_scheme="https" if app.config.get("HOST_URL") != "localhost" else "http",
         ident=app.config.get("SERVICE"),
     )